@@ -59,8 +59,17 @@ class AccountMove(models.Model):
                 )
         return request
 
-    def validate_taxes_on_invoice(self):
-        res = super().validate_taxes_on_invoice()
+    def _prepare_taxcloud_transaction_request(self):
+        request = super()._prepare_taxcloud_transaction_request()
+        if self.taxcloud_exemption_id.certificate_id:
+            request.ExemptionCertificate = request.factory.ExemptionCertificate()
+            request.ExemptionCertificate.CertificateID = (
+                self.taxcloud_exemption_id.certificate_id
+            )
+        return request
+
+    def _apply_taxcloud_taxes(self, request, response):
+        res = super()._apply_taxcloud_taxes(request, response)
         if self.taxcloud_exemption_id and self.total_tax_amount_tc:
             self.is_exemption_not_applied = True
         else:
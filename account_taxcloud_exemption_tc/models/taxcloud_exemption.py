@@ -222,6 +222,7 @@ class TaxcloudExemption(models.Model):
         api_id = shipper.taxcloud_api_id
         api_key = shipper.taxcloud_api_key
         request = self._get_TaxCloudRequest(api_id, api_key)
+        request.set_connection_detail(shipper)
         request.set_exemption_certificate_details(self)
         response = request.add_exemption_certificate()
         if response.get("error_message"):
@@ -239,6 +240,7 @@ class TaxcloudExemption(models.Model):
         api_id = shipper.taxcloud_api_id
         api_key = shipper.taxcloud_api_key
         request = self._get_TaxCloudRequest(api_id, api_key)
+        request.set_connection_detail(shipper)
         response = request.delete_exemption_certificate(self.certificate_id)
         if response.get("error_message"):
             raise ValidationError(
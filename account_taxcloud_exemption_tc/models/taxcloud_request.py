@@ -93,7 +93,8 @@ class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
             )
             return formatted_response
         try:
-            response = self.client.service.AddExemptCertificate(
+            response = self._call(
+                "AddExemptCertificate",
                 self.api_login_id, self.api_key, customer_id, self.exemption_certificate
             )
             formatted_response["response"] = response
@@ -126,7 +127,8 @@ class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
             )
             return formatted_response
         try:
-            response = self.client.service.DeleteExemptCertificate(
+            response = self._call(
+                "DeleteExemptCertificate",
                 self.api_login_id,
                 self.api_key,
                 certificate_id,
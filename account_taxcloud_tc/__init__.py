@@ -15,6 +15,7 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 from . import models
+from . import wizard
 
 from odoo.exceptions import UserError
 
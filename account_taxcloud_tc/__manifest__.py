@@ -28,8 +28,11 @@
         "views/product_view.xml",
         "views/res_config_settings_views.xml",
         "views/account_invoice_views.xml",
+        "views/taxcloud_outbox_views.xml",
+        "views/taxcloud_backfill_views.xml",
         "data/account_taxcloud_tc_data.xml",
         "data/mail_template_data.xml",
+        "data/ir_cron_data.xml",
     ],
     "license": "LGPL-3",
     "author": "Odoo S.A., Sodexis, TaxCloud",
@@ -22,3 +22,10 @@ from . import product
 from . import ir_module
 from . import mail_compose_message
 from . import account_tax
+from . import taxcloud_cache_mixin
+from . import taxcloud_address_cache
+from . import taxcloud_lookup_cache
+from . import taxcloud_rate
+from . import taxcloud_circuit_breaker
+from . import taxcloud_outbox
+from . import taxcloud_backfill
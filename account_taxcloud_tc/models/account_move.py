@@ -17,9 +17,14 @@
 
 import datetime
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pytz
 
 from odoo import _,api, fields, models
 from odoo.exceptions import UserError, ValidationError
+from odoo.fields import Command
 from odoo.tools import float_compare, float_round
 
 from .taxcloud_request import TaxCloudRequest
@@ -35,6 +40,10 @@ class AccountMove(models.Model):
     # Technical field to determine whether to hide taxes in views or not
     is_taxcloud = fields.Boolean(related="fiscal_position_id.is_taxcloud")
     total_tax_amount_tc = fields.Float("TaxCloud Total Tax")
+    # Inputs of the last TaxCloud validation, see _get_taxcloud_fingerprint
+    taxcloud_fingerprint = fields.Char(copy=False, readonly=True)
+    # Inputs of the invoice when it was registered (or queued) on TaxCloud
+    taxcloud_captured_fingerprint = fields.Char(copy=False, readonly=True)
 
     def _post(self, soft=True):
         # OVERRIDE
@@ -58,6 +67,21 @@ class AccountMove(models.Model):
             and not move._is_downpayment()
         )
 
+        concurrency = self._get_taxcloud_post_concurrency()
+        if len(invoices_to_validate) > 1 and concurrency > 1:
+            _validated, errors = invoices_to_validate.with_context(
+                taxcloud_authorize_transaction=True
+            )._validate_taxes_on_invoices(concurrency)
+            if errors and len(errors) == len(invoices_to_validate):
+                raise next(iter(errors.values()))
+            failed = self.browse()
+            for invoice, error in errors.items():
+                invoice.message_post(
+                    body=self.env._("Not posted, TaxCloud validation failed: %s", error)
+                )
+                failed |= invoice
+            return super(AccountMove, self - failed)._post(soft)
+
         if invoices_to_validate:
             for invoice in invoices_to_validate.with_context(
                 taxcloud_authorize_transaction=True
@@ -65,6 +89,15 @@ class AccountMove(models.Model):
                 invoice.validate_taxes_on_invoice()
         return super()._post(soft)
 
+    def _get_taxcloud_post_concurrency(self):
+        """Number of TaxCloud calls sent in parallel to post the invoices:
+        the ``taxcloud_post_concurrency`` context key, else the setting of
+        the company."""
+        concurrency = self.env.context.get("taxcloud_post_concurrency")
+        if concurrency is None:
+            concurrency = self.company_id[:1].taxcloud_post_concurrency
+        return concurrency or 1
+
     def button_draft(self):
         """At confirmation below, the AuthorizedWithCapture encodes the invoice
         in TaxCloud. Returned cancels it for a refund.
@@ -95,6 +128,19 @@ class AccountMove(models.Model):
         else:
             return fields.Datetime.context_timestamp(self, datetime.datetime.now())
 
+    def _get_taxcloud_reporting_tz(self):
+        """Timezone of the reporting date, the one of ``context_timestamp``."""
+        return self.env.context.get("tz") or self.env.user.tz or "UTC"
+
+    def _get_taxcloud_reporting_date_utc(self):
+        """Reporting date as a naive UTC datetime, to be stored in a
+        Datetime field. A date without timezone is in the user's one."""
+        reporting_date = self.get_taxcloud_reporting_date()
+        if reporting_date.tzinfo is None:
+            tz = pytz.timezone(self._get_taxcloud_reporting_tz())
+            reporting_date = tz.localize(reporting_date)
+        return reporting_date.astimezone(pytz.utc).replace(tzinfo=None)
+
     # Used to prepare the taxcloud request
     # So that we can inherit this method in another modules to update the request.
     def prepare_taxcloud_request(self):
@@ -102,26 +148,93 @@ class AccountMove(models.Model):
         api_id = shipper.taxcloud_api_id
         api_key = shipper.taxcloud_api_key
         request = self._get_TaxCloudRequest(api_id, api_key)
+        request.set_connection_detail(shipper)
         request.set_location_origin_detail(shipper)
         request.set_location_destination_detail(self.partner_shipping_id)
         request.set_invoice_items_detail(self)
         return request
 
-    def validate_taxes_on_invoice(self):
+    def _prepare_taxcloud_transaction_request(self):
+        """Request registering the posted invoice as it is (AddTransactions);
+        unlike ``prepare_taxcloud_request``, nothing is written on it."""
         self.ensure_one()
         company = self.company_id
+        request = self._get_TaxCloudRequest(
+            company.taxcloud_api_id, company.taxcloud_api_key
+        )
+        request.set_connection_detail(company)
+        request.set_location_origin_detail(company)
+        request.set_location_destination_detail(self.partner_shipping_id)
+        return request
+
+    def validate_taxes_on_invoice(self):
+        self.ensure_one()
+        request = self._prepare_taxcloud_validation()
+        if request is None:
+            return True
+        raise_warning = False
+        fingerprint = self._get_taxcloud_fingerprint(request)
+        if fingerprint != self.taxcloud_fingerprint:
+            response = request.get_all_taxes_values()
+            raise_warning = self._apply_taxcloud_taxes(request, response)
+            fingerprint = self._get_taxcloud_fingerprint(request)
+            self.taxcloud_fingerprint = fingerprint
+
+        # An invoice already registered as it is is not sent again.
+        if (
+            self.env.context.get("taxcloud_authorize_transaction")
+            and fingerprint != self.taxcloud_captured_fingerprint
+        ):
+            authorization = self._prepare_taxcloud_authorization(request)
+            if authorization:
+                method, args = authorization
+                try:
+                    response = method(*args)
+                except OSError:
+                    raise ValidationError(
+                        self.env._("TaxCloud Server Not Found")
+                    ) from None
+                self._check_taxcloud_authorization(response)
+            self.taxcloud_captured_fingerprint = fingerprint
+
+        if raise_warning:
+            return {
+                "warning": self.env._(
+                    """The tax rates have been updated, """
+                    """ you may want to check it before validation"""
+                )
+            }
+        else:
+            return True
+
+    def _get_taxcloud_fingerprint(self, request):
+        """Fingerprint of the request and of the line taxes: while it is
+        unchanged, the lookup would set the same taxes again."""
+        return request.document_fingerprint(
+            tuple(tuple(line.tax_ids.ids) for line in self.invoice_line_ids)
+        )
+
+    def _prepare_taxcloud_validation(self):
+        """First phase of ``validate_taxes_on_invoice``: build the request,
+        or return None if the invoice does not need to be sent."""
+        self.ensure_one()
         request = self.prepare_taxcloud_request()
         if len(request.cart_items.CartItem) == 0 and len(self.invoice_line_ids.filtered(lambda x: x.display_type not in ("line_note", "line_section"))) \
             and self.env.company.is_skip_zero_invoice:
-                return True
+                return None
         if float_compare(self.amount_total, 0.0, precision_rounding=self.currency_id.rounding) < 0:
             raise UserError(self.env._(
                 "You cannot validate a TaxCloud invoice with a negative total amount. "
                 "You should create a credit note instead. "
                 "Use the action menu to transform it into a credit note or refund."
             ))
-        response = request.get_all_taxes_values()
+        return request
 
+    def _apply_taxcloud_taxes(self, request, response):
+        """Set the taxes of the LookupForDate ``response`` to ``request`` on
+        the lines. Return whether any tax changed."""
+        self.ensure_one()
+        company = self.company_id
         if response.get("error_message"):
             raise ValidationError(
                 self.env._("Unable to retrieve taxes from TaxCloud: ")
@@ -133,142 +246,295 @@ class AccountMove(models.Model):
         if tax_values:
             self.total_tax_amount_tc = sum([value for key, value in tax_values.items()])
 
-        # warning: this is tightly coupled to TaxCloudRequest's _process_lines method
-        # do not modify without syncing the other method
         raise_warning = False
         taxes_to_set = []
-        tax_value_index = 0
-        for index, line in enumerate(self.invoice_line_ids):
-            if line.display_type in ("line_note", "line_section"):
-                taxes_to_set.append((index, 0))
+        for line in self.invoice_line_ids:
+            index = request.cart_line_indexes.get(line.id)
+            if index is None:
                 continue
-
-            if line._get_taxcloud_price() >= 0.0 and line.quantity >= 0.0:
-                if not line.price_subtotal and self.env.company.is_skip_zero_invoice:
-                    tax_value_index += 1
-                    continue
-                price = (
-                    line.price_unit
-                    * (1 - (line.discount or 0.0) / 100.0)
-                    * line.quantity
-                )
-                if not price:
-                    tax_rate = 0.0
-                else:
-                    if tax_value_index in tax_values:
-                        tax_rate = tax_values[tax_value_index] / price * 100
-                    else:
-                        tax_rate = 0.0
-                        _logger.warning(f"Tax value index {tax_value_index} not found in tax_values.")
-                tax_value_index += 1
-                if len(line.tax_ids) != 1 or float_compare(
-                    line.tax_ids.amount, tax_rate, precision_digits=3
-                ):
-                    raise_warning = True
-                    tax_rate = float_round(tax_rate, precision_digits=3)
-                    tax = (
-                        self.env["account.tax"]
-                        .sudo()
-                        .search(
-                            [
-                                *self.env["account.tax"]._check_company_domain(company),
-                                ("amount", "=", tax_rate),
-                                ("amount_type", "=", "percent"),
-                                ("type_tax_use", "=", "sale"),
-                            ],
-                            limit=1,
+            price = line.price_unit * (1 - (line.discount or 0.0) / 100.0) * line.quantity
+            if not price:
+                tax_rate = 0.0
+            elif index in tax_values:
+                tax_rate = tax_values[index] / price * 100
+            else:
+                tax_rate = 0.0
+                _logger.warning(f"Tax value index {index} not found in tax_values.")
+            if len(line.tax_ids) != 1 or float_compare(
+                line.tax_ids.amount, tax_rate, precision_digits=3
+            ):
+                raise_warning = True
+                taxes_to_set.append((line, float_round(tax_rate, precision_digits=3)))
+
+        taxes_by_rate = (
+            self.env["account.tax"]
+            .sudo()
+            .with_context(default_company_id=company.root_id.id)
+            ._get_taxcloud_taxes(company, [rate for _line, rate in taxes_to_set])
+        )
+        # A single write on the move, so that its tax lines and totals are
+        # recomputed once for all the lines.
+        if taxes_to_set:
+            self.write(
+                {
+                    "invoice_line_ids": [
+                        Command.update(
+                            line.id, {"tax_ids": [Command.set(taxes_by_rate[rate].ids)]}
                         )
-                    )
-                    if not tax:
-                        # Only set if not already set, otherwise it triggers a
-                        # needless and potentially heavy recompute for
-                        # everything related to the tax.
-                        # if not tax.active:
-                            # Needs to be active to be included in invoice total computation
-                            # tax.active = True
-                    # else:
-                        if company.is_default_tax_template:
-                            values = company.tax_template_id.copy_data({
-                                "name": "Tax %.3f %%" % (tax_rate),
-                                "amount": tax_rate,
-                                "invoice_label": "TaxCloud Tax",
-                                "active": True
-                            })
-                        else:
-                            values = {
-                                        "name": "Tax %.3f %%" % (tax_rate),
-                                        "amount": tax_rate,
-                                        "amount_type": "percent",
-                                        "type_tax_use": "sale",
-                                        "description": "Sales Tax",
-                                    }
-                        tax = (
-                                self.env["account.tax"]
-                                .sudo()
-                                .with_context(default_company_id=company.root_id.id)
-                                .create(
-                                    values
-                                )
-                            )
-                    taxes_to_set.append((index, tax))
-
-        for index, tax in taxes_to_set:
-            line = self.invoice_line_ids[index]
-            if line.display_type not in ("line_note", "line_section"):
-                line.tax_ids = False
-                line.tax_ids = tax
+                        for line, rate in taxes_to_set
+                    ]
+                }
+            )
 
-        if self.env.context.get("taxcloud_authorize_transaction"):
-            reporting_date = self.get_taxcloud_reporting_date()
+        return raise_warning
 
-            if self.move_type == "out_invoice":
-                response = request.get_taxcloud_authorize_with_capture(
-                    self, reporting_date
+    def _prepare_taxcloud_authorization(self, request):
+        """Return the ``(method, args)`` call registering the invoice (or
+        refund) on TaxCloud, or None. The call itself uses no cursor."""
+        self.ensure_one()
+        reporting_date = self.get_taxcloud_reporting_date()
+        use_outbox = self.company_id.taxcloud_use_outbox
+        outbox = self.env["taxcloud.outbox"].sudo()
+        # {invoice id: datetime} to send the queued calls at, e.g. to spread
+        # the calls of a batch of invoices.
+        next_attempt_date = self.env.context.get("taxcloud_outbox_dates", {}).get(
+            self.id
+        )
+        if self.move_type == "out_invoice":
+            if use_outbox:
+                outbox._enqueue(
+                    self,
+                    "authorized_with_capture",
+                    self._get_taxcloud_reporting_date_utc(),
+                    next_attempt_date,
                 )
-                if response.ResponseType == "Error":
-                    raise ValidationError(response.Messages.ResponseMessage[0].Message)
-            elif self.move_type == "out_refund":
-                request.set_invoice_items_detail(self)
-                origin_invoice = self.reversed_entry_id
-                if origin_invoice:
-                    response = request.get_taxcloud_returned(
-                        origin_invoice, self.invoice_date
-                    )
-                    if response.ResponseType == "Error":
-                        raise ValidationError(
-                            response.Messages.ResponseMessage[0].Message
-                        )
-                else:
-                    _logger.warning(
-                        """The source document on the refund is not valid"""
-                        """ and thus the refunded cart won't be logged on"""
-                        """ your taxcloud account."""
-                    )
+                return None
+            return request.get_taxcloud_authorize_with_capture, (self, reporting_date)
+        elif self.move_type == "out_refund":
+            origin_invoice = self.reversed_entry_id
+            if origin_invoice and use_outbox:
+                outbox._enqueue(self, "returned", None, next_attempt_date)
+                return None
+            request.set_invoice_items_detail(self)
+            if origin_invoice:
+                return request.get_taxcloud_returned, (origin_invoice, self.invoice_date)
+            _logger.warning(
+                """The source document on the refund is not valid"""
+                """ and thus the refunded cart won't be logged on"""
+                """ your taxcloud account."""
+            )
+        return None
+
+    def _check_taxcloud_authorization(self, response):
+        if response.ResponseType == "Error":
+            raise ValidationError(response.Messages.ResponseMessage[0].Message)
+
+    def _validate_taxes_on_invoices(self, concurrency):
+        """Batched ``validate_taxes_on_invoice``, used to post many invoices.
+
+        The carts are built for all the invoices first, then the address
+        verifications, the lookups and the authorizations are each sent
+        through a pool of ``concurrency`` threads. The threads only do
+        network calls: every ORM access happens in the current thread.
+        Return ``(validated, errors)``: the invoices sent to TaxCloud that
+        succeeded, and ``{invoice: exception}`` for the invoices that failed,
+        with any exception. The changes of the latter are rolled back and
+        the others are not affected. Invoices that are not sent to TaxCloud
+        at all are in neither.
+        """
+        errors = {}
+        # Prefetch what the carts and addresses need for the whole batch.
+        self.mapped("invoice_line_ids.tax_ids")
+        self.mapped("partner_shipping_id.state_id")
 
-        if raise_warning:
-            return {
-                "warning": self.env._(
-                    """The tax rates have been updated, """
-                    """ you may want to check it before validation"""
-                )
+        requests_by_invoice = {}
+        for invoice in self:
+            try:
+                with self.env.cr.savepoint():
+                    request = invoice._prepare_taxcloud_validation()
+            except Exception as error:
+                errors[invoice] = invoice._get_taxcloud_batch_error(error)
+                continue
+            if request is not None:
+                requests_by_invoice[invoice] = request
+        # The retries of the whole batch share one deadline.
+        batch_deadline = int(
+            self.env["ir.config_parameter"].sudo().get_param(
+                "account_taxcloud_tc.batch_deadline", 120
+            )
+        )
+        for request in requests_by_invoice.values():
+            request.set_deadline(batch_deadline)
+
+        # Invoices validated before with the same inputs only need to be
+        # authorized.
+        to_lookup = {
+            invoice: request
+            for invoice, request in requests_by_invoice.items()
+            if invoice._get_taxcloud_fingerprint(request) != invoice.taxcloud_fingerprint
+        }
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="taxcloud"
+        ) as executor:
+            for invoice, error in self._verify_taxcloud_addresses(
+                executor, to_lookup
+            ).items():
+                errors.setdefault(invoice, error)
+                requests_by_invoice.pop(invoice, None)
+                to_lookup.pop(invoice, None)
+
+            futures = {
+                executor.submit(request.get_all_taxes_values): invoice
+                for invoice, request in to_lookup.items()
             }
-        else:
-            return True
+            responses = {}
+            for future in as_completed(futures):
+                invoice = futures[future]
+                try:
+                    responses[invoice] = future.result()
+                except Exception as error:
+                    errors[invoice] = invoice._get_taxcloud_batch_error(error)
+                    requests_by_invoice.pop(invoice)
+
+            authorizations = {}
+            fingerprints = {}
+            for invoice, request in requests_by_invoice.items():
+                try:
+                    with self.env.cr.savepoint():
+                        if invoice in responses:
+                            invoice._apply_taxcloud_taxes(request, responses[invoice])
+                            invoice.taxcloud_fingerprint = (
+                                invoice._get_taxcloud_fingerprint(request)
+                            )
+                        fingerprint = invoice.taxcloud_fingerprint
+                        if (
+                            self.env.context.get("taxcloud_authorize_transaction")
+                            and fingerprint != invoice.taxcloud_captured_fingerprint
+                        ):
+                            authorization = invoice._prepare_taxcloud_authorization(
+                                request
+                            )
+                            if authorization:
+                                authorizations[invoice] = authorization
+                                fingerprints[invoice] = fingerprint
+                            else:
+                                invoice.taxcloud_captured_fingerprint = fingerprint
+                except Exception as error:
+                    errors[invoice] = invoice._get_taxcloud_batch_error(error)
+
+            futures = {
+                executor.submit(method, *args): invoice
+                for invoice, (method, args) in authorizations.items()
+            }
+            for future in as_completed(futures):
+                invoice = futures[future]
+                try:
+                    with self.env.cr.savepoint():
+                        invoice._check_taxcloud_authorization(future.result())
+                        invoice.taxcloud_captured_fingerprint = fingerprints[invoice]
+                except Exception as error:
+                    errors[invoice] = invoice._get_taxcloud_batch_error(error)
+        validated = self.browse(
+            [invoice.id for invoice in requests_by_invoice if invoice not in errors]
+        )
+        return validated, errors
+
+    def _get_taxcloud_batch_error(self, error):
+        """Return the error to report for the invoice failing in a batch,
+        from the exception being handled; unexpected ones are logged."""
+        if isinstance(error, OSError):
+            return ValidationError(self.env._("TaxCloud Server Not Found"))
+        if not isinstance(error, UserError):
+            _logger.warning(
+                "TaxCloud validation of invoice %s failed", self.id, exc_info=True
+            )
+        return error
+
+    def _verify_taxcloud_addresses(self, executor, requests_by_invoice):
+        """Verify through ``executor`` the addresses of the requests that are
+        not cached yet, so that resolving them afterwards hits the cache.
+        Return ``{invoice: exception}`` for the invoices whose addresses
+        could not be verified."""
+        AddressCache = self.env["taxcloud.address.cache"].sudo()
+        to_verify = {}
+        invoices_by_fingerprint = defaultdict(list)
+        for invoice, request in requests_by_invoice.items():
+            for partner in (request._origin_partner, request._destination_partner):
+                if partner is None:
+                    continue
+                address = request._get_address_to_verify(partner)
+                fingerprint = AddressCache._fingerprint(address)
+                if fingerprint in to_verify or AddressCache._get(fingerprint) is None:
+                    to_verify[fingerprint] = (request, address)
+                    invoices_by_fingerprint[fingerprint].append(invoice)
+
+        errors = {}
+        futures = {
+            executor.submit(request._verify_address_remote, address): fingerprint
+            for fingerprint, (request, address) in to_verify.items()
+        }
+        for future in as_completed(futures):
+            fingerprint = futures[future]
+            try:
+                address, verified = future.result()
+            except Exception as error:
+                for invoice in invoices_by_fingerprint[fingerprint]:
+                    errors[invoice] = invoice._get_taxcloud_batch_error(error)
+                continue
+            AddressCache._store(fingerprint, address, verified)
+
+        for invoice, request in requests_by_invoice.items():
+            if invoice in errors:
+                continue
+            try:
+                # Resolve the addresses now, from the cache.
+                request.origin  # noqa: B018
+                request.destination  # noqa: B018
+            except Exception as error:
+                errors[invoice] = invoice._get_taxcloud_batch_error(error)
+        return errors
 
     def _invoice_paid_hook(self):
         for invoice in self:
             company = invoice.company_id
-            if invoice.fiscal_position_id.is_taxcloud:
+            if invoice.fiscal_position_id.is_taxcloud and company.taxcloud_use_outbox:
+                if invoice.move_type == "out_invoice":
+                    self.env["taxcloud.outbox"].sudo()._enqueue(invoice, "captured")
+                elif invoice.reversed_entry_id:
+                    self.env["taxcloud.outbox"].sudo()._enqueue(invoice, "returned")
+                else:
+                    _logger.warning(
+                        """The source document on the refund %i is not valid"""
+                        """ and thus the refunded cart won't be logged on your"""
+                        """ taxcloud account""",
+                        invoice.id,
+                    )
+            elif invoice.fiscal_position_id.is_taxcloud:
                 api_id = company.taxcloud_api_id
                 api_key = company.taxcloud_api_key
                 request = TaxCloudRequest(api_id, api_key)
+                request.set_connection_detail(company)
                 if invoice.move_type == "out_invoice":
-                    request.get_taxcloud_captured(invoice)
+                    try:
+                        request.get_taxcloud_captured(invoice)
+                    except OSError:
+                        # Do not prevent the payment from being registered.
+                        _logger.exception(
+                            "Could not capture invoice %i on TaxCloud", invoice.id
+                        )
                 else:
                     request.set_invoice_items_detail(invoice)
                     origin_invoice = invoice.reversed_entry_id
                     if origin_invoice:
-                        request.get_taxcloud_returned(origin_invoice, invoice.invoice_date)
+                        try:
+                            request.get_taxcloud_returned(
+                                origin_invoice, invoice.invoice_date
+                            )
+                        except OSError:
+                            _logger.exception(
+                                "Could not return refund %i on TaxCloud", invoice.id
+                            )
                     else:
                         _logger.warning(
                             """The source document on the refund %i is not valid"""
@@ -16,11 +16,77 @@
 
 import re
 
-from odoo import api, models
+from odoo import api, models, tools
+from odoo.tools import float_repr
 
 class AccountTax(models.Model):
     _inherit = 'account.tax'
 
+    @api.model
+    def _get_taxcloud_taxes_version(self):
+        """Return a token that changes whenever a tax is created, written or
+        deleted, to key the rate index cache."""
+        self.flush_model(["write_date"])
+        self.env.cr.execute("SELECT MAX(write_date), COUNT(*) FROM account_tax")
+        return tuple(str(value) for value in self.env.cr.fetchone())
+
+    @api.model
+    @tools.ormcache("company_id", "taxes_version")
+    def _get_taxcloud_rate_index(self, company_id, taxes_version):
+        """Return ``{rate: tax id}`` for the active percent sale taxes usable
+        by the company, the rate being formatted with 3 decimals."""
+        company = self.env["res.company"].browse(company_id)
+        taxes = self.sudo().with_context(active_test=True).search_read(
+            [
+                *self._check_company_domain(company),
+                ("amount_type", "=", "percent"),
+                ("type_tax_use", "=", "sale"),
+            ],
+            ["amount"],
+        )
+        index = {}
+        for tax in taxes:
+            # Keep the first tax by the default order, as search(limit=1) did.
+            index.setdefault(float_repr(tax["amount"], 3), tax["id"])
+        return index
+
+    @api.model
+    def _get_taxcloud_taxes(self, company, rates):
+        """Return ``{rate: tax}`` for the given rates (rounded to 3 digits),
+        creating the missing taxes in a single call. The taxes are created
+        for the ``default_company_id`` of the context."""
+        index = self._get_taxcloud_rate_index(
+            company.id, self._get_taxcloud_taxes_version()
+        )
+        taxes = {}
+        missing_rates = []
+        for rate in set(rates):
+            tax_id = index.get(float_repr(rate, 3))
+            if tax_id:
+                taxes[rate] = self.browse(tax_id)
+            else:
+                missing_rates.append(rate)
+        if missing_rates:
+            vals_list = []
+            for tax_rate in missing_rates:
+                if company.is_default_tax_template:
+                    vals_list += company.tax_template_id.copy_data({
+                        "name": "Tax %.3f %%" % (tax_rate),
+                        "amount": tax_rate,
+                        "invoice_label": "TaxCloud Tax",
+                        "active": True
+                    })
+                else:
+                    vals_list.append({
+                        "name": "Tax %.3f %%" % (tax_rate),
+                        "amount": tax_rate,
+                        "amount_type": "percent",
+                        "type_tax_use": "sale",
+                        "description": "Sales Tax",
+                    })
+            taxes.update(zip(missing_rates, self.create(vals_list)))
+        return taxes
+
     @api.onchange('name')
     def onchange_name(self):
         name = self.name
@@ -59,6 +59,50 @@ class ProductTemplate(models.Model):
     )
 
 
+class ProductProduct(models.Model):
+    _inherit = "product.product"
+
+    taxcloud_tic_category_id = fields.Many2one(
+        "product.tic.category",
+        string="Effective TIC Code",
+        compute="_compute_taxcloud_tic_category_id",
+        store=True,
+        index=True,
+        help="TIC sent to TaxCloud for this product: the one of the product, "
+        "or else of its product category. When empty, the default TIC of "
+        "the company applies.",
+    )
+
+    @api.depends(
+        "product_tmpl_id.tic_category_id", "product_tmpl_id.categ_id.tic_category_id"
+    )
+    def _compute_taxcloud_tic_category_id(self):
+        for product in self:
+            product.taxcloud_tic_category_id = (
+                product.tic_category_id or product.categ_id.tic_category_id
+            )
+
+    @api.model
+    def _get_taxcloud_tic_codes(self, product_ids):
+        """Return ``{product id: TIC code}`` for the given products having an
+        effective TIC, read in one query."""
+        if not product_ids:
+            return {}
+        self.flush_model(["taxcloud_tic_category_id"])
+        self.env["product.tic.category"].flush_model(["code"])
+        self.env.cr.execute(
+            """
+            SELECT product.id, tic.code
+              FROM product_product product
+              JOIN product_tic_category tic
+                ON tic.id = product.taxcloud_tic_category_id
+             WHERE product.id IN %s
+            """,
+            [tuple(product_ids)],
+        )
+        return dict(self.env.cr.fetchall())
+
+
 class ResCompany(models.Model):
     _inherit = "res.company"
 
@@ -82,6 +126,40 @@ class ResCompany(models.Model):
     is_default_tax_template = fields.Boolean(string="Default Tax Template")
     tax_template_id = fields.Many2one("account.tax", string="Default Tax", domain=[("type_tax_use","=","sale")])
     is_skip_zero_invoice = fields.Boolean(string="Skip Zero Invoice")
+    taxcloud_pool_size = fields.Integer(
+        string="TaxCloud Connection Pool Size",
+        default=10,
+        help="Maximum number of keep-alive connections to TaxCloud per worker.",
+    )
+    taxcloud_connect_timeout = fields.Integer(
+        string="TaxCloud Connect Timeout",
+        default=10,
+        help="Seconds to wait for a connection to TaxCloud.",
+    )
+    taxcloud_read_timeout = fields.Integer(
+        string="TaxCloud Read Timeout",
+        default=60,
+        help="Seconds to wait for a TaxCloud response.",
+    )
+    taxcloud_use_gzip = fields.Boolean(
+        string="TaxCloud Gzip Compression",
+        default=True,
+        help="Ask TaxCloud for compressed responses.",
+    )
+    taxcloud_post_concurrency = fields.Integer(
+        string="TaxCloud Posting Concurrency",
+        default=1,
+        help="Number of TaxCloud calls sent in parallel when several invoices "
+        "are posted at once. Above 1, an invoice that fails validation is left "
+        "in draft (with a message) instead of preventing the others from "
+        "being posted.",
+    )
+    taxcloud_use_outbox = fields.Boolean(
+        string="Send TaxCloud Transactions in Background",
+        help="Queue the AuthorizedWithCapture, Captured and Returned calls and "
+        "send them from a scheduled action, instead of waiting for TaxCloud "
+        "when posting invoices and registering payments.",
+    )
 
 
     @api.depends("taxcloud_api_id", "taxcloud_api_key")
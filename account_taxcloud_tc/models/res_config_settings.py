@@ -41,6 +41,27 @@ class ResConfigSettings(models.TransientModel):
     tax_template_id = fields.Many2one("account.tax", related="company_id.tax_template_id", string="Tax Template", domain=[("type_tax_use","=","sale")], readonly=False)
     notify_email_sent = fields.Boolean(string="Notify Email Sent", config_parameter='account_taxcloud_tc.notify_email_sent', readonly=True)
     is_skip_zero_invoice = fields.Boolean(string="Skip Zero Invoice", related="company_id.is_skip_zero_invoice", readonly=False)
+    taxcloud_pool_size = fields.Integer(related="company_id.taxcloud_pool_size", readonly=False)
+    taxcloud_connect_timeout = fields.Integer(related="company_id.taxcloud_connect_timeout", readonly=False)
+    taxcloud_read_timeout = fields.Integer(related="company_id.taxcloud_read_timeout", readonly=False)
+    taxcloud_use_gzip = fields.Boolean(related="company_id.taxcloud_use_gzip", readonly=False)
+    taxcloud_post_concurrency = fields.Integer(related="company_id.taxcloud_post_concurrency", readonly=False)
+    taxcloud_use_outbox = fields.Boolean(related="company_id.taxcloud_use_outbox", readonly=False)
+    taxcloud_address_cache_ttl = fields.Integer(
+        string="Verified Address Cache (days)",
+        config_parameter="account_taxcloud_tc.address_cache_ttl_days",
+        default=30,
+    )
+    taxcloud_retry_max_attempts = fields.Integer(
+        string="Attempts per Call",
+        config_parameter="account_taxcloud_tc.retry_max_attempts",
+        default=3,
+    )
+    taxcloud_retry_deadline = fields.Integer(
+        string="Retry Deadline (s)",
+        config_parameter="account_taxcloud_tc.retry_deadline",
+        default=30,
+    )
 
     @api.onchange('is_default_tax_template')
     def onchange_is_default_tax_template(self):
@@ -50,6 +71,7 @@ class ResConfigSettings(models.TransientModel):
     def sync_taxcloud_category(self):
         Category = self.env["product.tic.category"]
         request = TaxCloudRequest(self.taxcloud_api_id, self.taxcloud_api_key)
+        request.set_connection_detail(self.company_id)
         res = request.get_tic_category()
 
         if res.get("error_message"):
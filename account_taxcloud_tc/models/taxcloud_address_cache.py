@@ -0,0 +1,106 @@
+import logging
+import re
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from .taxcloud_request import make_fingerprint
+
+_logger = logging.getLogger(__name__)
+
+ADDRESS_FIELDS = ("Address1", "Address2", "City", "State", "Zip5", "Zip4")
+
+
+def normalize_address_part(value):
+    """Uppercase, drop punctuation and collapse whitespace so that trivial
+    spelling differences ("Ste. 4" / "STE 4") share the same cache entry."""
+    return " ".join(re.sub(r"[^0-9A-Z]+", " ", str(value or "").upper()).split())
+
+
+class TaxCloudAddressCache(models.Model):
+    """Addresses verified through TaxCloud VerifyAddress, shared by all workers.
+
+    Unverifiable addresses are stored as well (``is_verified`` unset) so that
+    the fallback to the unverified address does not hit the API again.
+    """
+
+    _name = "taxcloud.address.cache"
+    _inherit = "taxcloud.cache.mixin"
+    _description = "TaxCloud Verified Address Cache"
+    _rec_name = "fingerprint"
+
+    address1 = fields.Char(readonly=True)
+    address2 = fields.Char(readonly=True)
+    city = fields.Char(readonly=True)
+    state = fields.Char(readonly=True)
+    zip5 = fields.Char(readonly=True)
+    zip4 = fields.Char(readonly=True)
+    is_verified = fields.Boolean(readonly=True)
+
+    _sql_constraints = [
+        (
+            "fingerprint_unique",
+            "UNIQUE(fingerprint)",
+            "An address can only be cached once.",
+        ),
+    ]
+
+    @api.model
+    def _fingerprint(self, address):
+        """:param address: dict with the VerifyAddress keys (Address1, ..., Zip4)"""
+        return make_fingerprint(
+            *(normalize_address_part(address.get(k)) for k in ADDRESS_FIELDS)
+        )
+
+    @api.model
+    def _get_ttl(self, verified):
+        if verified:
+            return timedelta(days=self._get_param("address_cache_ttl_days", 30))
+        return timedelta(hours=self._get_param("address_cache_negative_ttl_hours", 24))
+
+    @api.model
+    def _get(self, fingerprint):
+        """Return the cached address as a VerifyAddress-like dict,
+        or None if there is no valid entry."""
+        self.env.cr.execute(
+            """
+            SELECT address1, address2, city, state, zip5, zip4
+              FROM taxcloud_address_cache
+             WHERE fingerprint = %s
+               AND expiry_date > NOW() AT TIME ZONE 'UTC'
+            """,
+            [fingerprint],
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        return dict(zip(ADDRESS_FIELDS, row))
+
+    @api.model
+    def _store(self, fingerprint, address, verified):
+        """Insert or refresh the entry; safe against concurrent workers
+        storing the same address."""
+        expiry_date = fields.Datetime.now() + self._get_ttl(verified)
+        values = [address.get(k) or "" for k in ADDRESS_FIELDS]
+        self._execute_best_effort(
+            """
+            INSERT INTO taxcloud_address_cache
+                (fingerprint, address1, address2, city, state, zip5, zip4,
+                 is_verified, expiry_date,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (fingerprint) DO UPDATE
+               SET address1 = EXCLUDED.address1,
+                   address2 = EXCLUDED.address2,
+                   city = EXCLUDED.city,
+                   state = EXCLUDED.state,
+                   zip5 = EXCLUDED.zip5,
+                   zip4 = EXCLUDED.zip4,
+                   is_verified = EXCLUDED.is_verified,
+                   expiry_date = EXCLUDED.expiry_date,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            [fingerprint, *values, verified, expiry_date, self.env.uid, self.env.uid],
+        )
@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class TaxCloudBackfill(models.Model):
+    """Registration of already posted invoices on TaxCloud, by batches of
+    AddTransactions calls, e.g. when onboarding a company.
+
+    The invoices are read in id order, one batch at a time (keyset
+    pagination), and each batch is committed with the id of its last
+    invoice: an interrupted backfill resumes after the last batch sent.
+    """
+
+    _name = "taxcloud.backfill"
+    _description = "TaxCloud Transactions Backfill"
+    _order = "id desc"
+
+    name = fields.Char(compute="_compute_name")
+    company_id = fields.Many2one(
+        "res.company", required=True, default=lambda self: self.env.company
+    )
+    date_from = fields.Date(required=True)
+    date_to = fields.Date(required=True)
+    batch_size = fields.Integer(required=True, default=100)
+    state = fields.Selection(
+        [
+            ("draft", "Draft"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        required=True,
+        default="draft",
+        readonly=True,
+    )
+    last_move_id = fields.Integer(
+        string="Checkpoint",
+        readonly=True,
+        help="Id of the last invoice sent: the backfill resumes after it.",
+    )
+    sent_count = fields.Integer(string="Invoices Sent", readonly=True)
+    skipped_count = fields.Integer(
+        string="Invoices Skipped",
+        readonly=True,
+        help="Invoices of the sent batches that were already registered on TaxCloud.",
+    )
+    batch_count = fields.Integer(string="Batches Sent", readonly=True)
+    duration = fields.Float(
+        string="Sending Time (s)", readonly=True, help="Time spent sending batches."
+    )
+    throughput = fields.Float(
+        string="Invoices per Second", compute="_compute_throughput", digits=(16, 2)
+    )
+    last_error = fields.Text(readonly=True)
+
+    @api.depends("company_id", "date_from", "date_to")
+    def _compute_name(self):
+        for backfill in self:
+            backfill.name = "%s: %s - %s" % (
+                backfill.company_id.name,
+                backfill.date_from,
+                backfill.date_to,
+            )
+
+    @api.depends("sent_count", "duration")
+    def _compute_throughput(self):
+        for backfill in self:
+            backfill.throughput = (
+                backfill.sent_count / backfill.duration if backfill.duration else 0.0
+            )
+
+    def action_start(self):
+        self.write({"state": "running", "last_error": False})
+        self.env.ref("account_taxcloud_tc.ir_cron_taxcloud_backfill")._trigger()
+
+    def action_stop(self):
+        self.filtered(lambda backfill: backfill.state == "running").write(
+            {"state": "draft"}
+        )
+
+    def _get_invoice_domain(self):
+        self.ensure_one()
+        # Invoices authorized when posted are already registered on TaxCloud,
+        # whether synchronously or through the outbox.
+        registered = (
+            self.env["taxcloud.outbox"]
+            .sudo()
+            ._search(
+                [
+                    ("operation", "=", "authorized_with_capture"),
+                    ("state", "=", "done"),
+                ]
+            )
+        )
+        return [
+            ("company_id", "=", self.company_id.id),
+            ("move_type", "=", "out_invoice"),
+            ("state", "=", "posted"),
+            ("fiscal_position_id.is_taxcloud", "=", True),
+            ("invoice_date", ">=", self.date_from),
+            ("invoice_date", "<=", self.date_to),
+            ("id", ">", self.last_move_id),
+            ("taxcloud_captured_fingerprint", "=", False),
+            ("id", "not in", registered.subselect("move_id")),
+        ]
+
+    @api.model
+    def _cron_run(self, time_limit=240):
+        """Send batches of the running backfills for up to ``time_limit``
+        seconds, then let the cron start again if there is more to send."""
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        deadline = time.monotonic() + time_limit
+        for backfill in self.search([("state", "=", "running")], order="id"):
+            while backfill.state == "running" and time.monotonic() < deadline:
+                backfill._send_batch()
+                if auto_commit:
+                    self.env.cr.commit()
+        if self.search_count([("state", "=", "running")], limit=1):
+            self.env.ref("account_taxcloud_tc.ir_cron_taxcloud_backfill")._trigger()
+
+    def _send_batch(self):
+        self.ensure_one()
+        invoices = self.env["account.move"].search(
+            self._get_invoice_domain(), order="id", limit=max(self.batch_size, 1)
+        )
+        if not invoices:
+            self.state = "done"
+            _logger.info(
+                "TaxCloud backfill %s done: %s invoices in %.1fs (%.1f/s)",
+                self.id,
+                self.sent_count,
+                self.duration,
+                self.throughput,
+            )
+            return
+        # Prefetch what the carts and addresses need for the whole batch.
+        invoices.mapped("invoice_line_ids.tax_ids")
+        invoices.mapped("partner_shipping_id.state_id")
+
+        start = time.monotonic()
+        transactions = []
+        request = None
+        for invoice in invoices:
+            request = invoice._prepare_taxcloud_transaction_request()
+            try:
+                transactions.append(request.get_transaction(invoice))
+            except OSError:
+                response = {"error_message": "TaxCloud Server Not Found"}
+                break
+        else:
+            response = request.add_transactions(transactions)
+            if response.get("duplicate"):
+                response = self._add_transactions_one_by_one(request, transactions)
+        if response.get("error_message"):
+            self.write({"state": "failed", "last_error": response["error_message"]})
+            _logger.warning(
+                "TaxCloud backfill %s stopped after invoice %s: %s",
+                self.id,
+                self.last_move_id,
+                response["error_message"],
+            )
+            return
+        elapsed = time.monotonic() - start
+        self.write(
+            {
+                "last_move_id": invoices[-1].id,
+                "sent_count": self.sent_count
+                + len(invoices)
+                - response.get("skipped_count", 0),
+                "skipped_count": self.skipped_count + response.get("skipped_count", 0),
+                "batch_count": self.batch_count + 1,
+                "duration": self.duration + elapsed,
+            }
+        )
+        _logger.info(
+            "TaxCloud backfill %s: %s invoices sent in %.1fs (%.1f/s overall)",
+            self.id,
+            len(invoices),
+            elapsed,
+            self.throughput,
+        )
+
+    def _add_transactions_one_by_one(self, request, transactions):
+        """Send the ``transactions`` of a batch TaxCloud rejected because
+        some of them are already registered, one at a time, skipping the
+        duplicates."""
+        skipped = []
+        for transaction in transactions:
+            response = request.add_transactions([transaction])
+            if response.get("duplicate"):
+                skipped.append(transaction.orderID)
+            elif response.get("error_message"):
+                return response
+        _logger.info(
+            "TaxCloud backfill %s: invoices %s already registered, skipped",
+            self.id,
+            skipped,
+        )
+        return {"skipped_count": len(skipped)}
@@ -0,0 +1,46 @@
+import logging
+
+from psycopg2 import errors
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class TaxCloudCacheMixin(models.AbstractModel):
+    """Common plumbing of the database-backed TaxCloud caches.
+
+    Cache writes are best effort: a concurrent worker storing the same key
+    must never make the business transaction fail.
+    """
+
+    _name = "taxcloud.cache.mixin"
+    _description = "TaxCloud Cache Mixin"
+
+    fingerprint = fields.Char(required=True, index=True, readonly=True)
+    expiry_date = fields.Datetime(required=True, index=True, readonly=True)
+
+    @api.model
+    def _get_param(self, key, default):
+        return int(
+            self.env["ir.config_parameter"].sudo().get_param(
+                "account_taxcloud_tc.%s" % key, default
+            )
+        )
+
+    @api.model
+    def _execute_best_effort(self, query, params):
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(query, params)
+        except (errors.SerializationFailure, errors.UniqueViolation):
+            _logger.debug("concurrent update of %s, entry not stored", self._table)
+
+    @api.model
+    def _gc_expired(self):
+        self.env.cr.execute(
+            "DELETE FROM %s WHERE expiry_date <= NOW() AT TIME ZONE 'UTC'" % self._table
+        )
+        _logger.info(
+            "removed %s expired entries from %s", self.env.cr.rowcount, self._table
+        )
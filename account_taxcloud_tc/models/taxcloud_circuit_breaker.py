@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+
+from psycopg2 import errors
+
+from odoo import api, fields, models
+
+from .taxcloud_request import TaxCloudUnavailable
+
+_logger = logging.getLogger(__name__)
+
+# Seconds during which a worker trusts its in-memory copy of the state.
+STATE_REFRESH_INTERVAL = 5
+
+
+class TaxCloudCircuitBreaker(models.Model):
+    """Circuit breaker around the TaxCloud calls, one per API login.
+
+    After ``breaker_failure_threshold`` consecutive connection failures or
+    timeouts the breaker opens and calls fail immediately. Once
+    ``breaker_reset_seconds`` have elapsed, a single worker moves it to
+    half-open and probes TaxCloud with the Ping operation: a success closes
+    the breaker, a failure opens it again.
+
+    The state lives in the database so that one worker tripping protects
+    all the others. It is read and written through separate cursors, both
+    to survive a rollback of the business transaction and to see the
+    changes of other workers regardless of the current snapshot; workers
+    keep a copy of it for a few seconds. No method uses the environment
+    cursor, so that requests may be sent from threads.
+    """
+
+    _name = "taxcloud.circuit.breaker"
+    _description = "TaxCloud Circuit Breaker"
+    _rec_name = "api_login_id"
+
+    api_login_id = fields.Char(required=True, readonly=True)
+    state = fields.Selection(
+        [("closed", "Closed"), ("open", "Open"), ("half_open", "Half-Open")],
+        required=True,
+        default="closed",
+        readonly=True,
+    )
+    failure_count = fields.Integer(readonly=True)
+    opened_date = fields.Datetime(readonly=True)
+
+    _sql_constraints = [
+        (
+            "api_login_id_unique",
+            "UNIQUE(api_login_id)",
+            "There is one circuit breaker per TaxCloud API login.",
+        ),
+    ]
+
+    _states_lock = threading.Lock()
+    # {(database, api login): (state, failure count, fetched at)}
+    _states = {}
+
+    @api.model
+    def _get_settings(self, cr):
+        cr.execute(
+            """
+            SELECT key, value
+              FROM ir_config_parameter
+             WHERE key IN ('account_taxcloud_tc.breaker_failure_threshold',
+                           'account_taxcloud_tc.breaker_reset_seconds')
+            """
+        )
+        params = dict(cr.fetchall())
+        return (
+            int(params.get("account_taxcloud_tc.breaker_failure_threshold", 5)),
+            int(params.get("account_taxcloud_tc.breaker_reset_seconds", 30)),
+        )
+
+    @api.model
+    def _get_state(self, api_login_id, refresh=False):
+        key = (self.env.registry.db_name, api_login_id)
+        cached = self._states.get(key)
+        if (
+            cached
+            and not refresh
+            and time.monotonic() - cached[2] < STATE_REFRESH_INTERVAL
+        ):
+            return cached[0], cached[1]
+        with self.env.registry.cursor() as cr:
+            cr.execute(
+                """
+                SELECT state, failure_count
+                  FROM taxcloud_circuit_breaker
+                 WHERE api_login_id = %s
+                """,
+                [api_login_id],
+            )
+            state, failure_count = cr.fetchone() or ("closed", 0)
+        self._set_state(api_login_id, state, failure_count)
+        return state, failure_count
+
+    @api.model
+    def _set_state(self, api_login_id, state, failure_count):
+        with self._states_lock:
+            self._states[(self.env.registry.db_name, api_login_id)] = (
+                state,
+                failure_count,
+                time.monotonic(),
+            )
+
+    @api.model
+    def _record_failure(self, api_login_id):
+        try:
+            state, failure_count = self._increment_failures(api_login_id)
+        except errors.SerializationFailure:
+            # Another worker recorded a failure at the same time.
+            return
+        self._set_state(api_login_id, state, failure_count)
+
+    @api.model
+    def _increment_failures(self, api_login_id):
+        with self.env.registry.cursor() as cr:
+            threshold, _reset_seconds = self._get_settings(cr)
+            cr.execute(
+                """
+                INSERT INTO taxcloud_circuit_breaker
+                    (api_login_id, state, failure_count,
+                     create_date, write_date)
+                VALUES (%s, 'closed', 1,
+                        NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+                ON CONFLICT (api_login_id) DO UPDATE
+                   SET failure_count = taxcloud_circuit_breaker.failure_count + 1,
+                       write_date = EXCLUDED.write_date
+             RETURNING state, failure_count
+                """,
+                [api_login_id],
+            )
+            state, failure_count = cr.fetchone()
+            if state != "open" and failure_count >= threshold:
+                cr.execute(
+                    """
+                    UPDATE taxcloud_circuit_breaker
+                       SET state = 'open',
+                           opened_date = NOW() AT TIME ZONE 'UTC'
+                     WHERE api_login_id = %s
+                    """,
+                    [api_login_id],
+                )
+                state = "open"
+                _logger.warning(
+                    "TaxCloud circuit breaker opened for %s after %s failures",
+                    api_login_id,
+                    failure_count,
+                )
+        return state, failure_count
+
+    @api.model
+    def _record_success(self, api_login_id):
+        state, failure_count = self._get_state(api_login_id)
+        if state == "closed" and not failure_count:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute(
+                    """
+                    UPDATE taxcloud_circuit_breaker
+                       SET state = 'closed',
+                           failure_count = 0,
+                           opened_date = NULL,
+                           write_date = NOW() AT TIME ZONE 'UTC'
+                     WHERE api_login_id = %s
+                    """,
+                    [api_login_id],
+                )
+        except errors.SerializationFailure:
+            return
+        if state != "closed":
+            _logger.info("TaxCloud circuit breaker closed for %s", api_login_id)
+        self._set_state(api_login_id, "closed", 0)
+
+    @api.model
+    def _try_half_open(self, api_login_id, probe_timeout=0):
+        """Move an open breaker whose reset timeout elapsed to half-open.
+        Return True for the single worker allowed to probe TaxCloud.
+
+        A probe lasts at most ``probe_timeout`` seconds: a half-open breaker
+        whose probe never reported back by then (e.g. the probing worker
+        was killed) can be probed again."""
+        with self.env.registry.cursor() as cr:
+            _threshold, reset_seconds = self._get_settings(cr)
+            cr.execute(
+                """
+                UPDATE taxcloud_circuit_breaker
+                   SET state = 'half_open',
+                       opened_date = NOW() AT TIME ZONE 'UTC'
+                 WHERE api_login_id = %s
+                   AND (
+                       (state = 'open'
+                        AND opened_date <= NOW() AT TIME ZONE 'UTC'
+                                           - %s * INTERVAL '1 second')
+                    OR (state = 'half_open'
+                        AND opened_date <= NOW() AT TIME ZONE 'UTC'
+                                           - %s * INTERVAL '1 second')
+                   )
+                """,
+                [api_login_id, reset_seconds, reset_seconds + probe_timeout],
+            )
+            return cr.rowcount == 1
+
+    @api.model
+    def _probe(self, request, api_login_id):
+        try:
+            request.client.service.Ping(request.api_login_id, request.api_key)
+        except OSError as error:
+            with self.env.registry.cursor() as cr:
+                cr.execute(
+                    """
+                    UPDATE taxcloud_circuit_breaker
+                       SET state = 'open',
+                           opened_date = NOW() AT TIME ZONE 'UTC'
+                     WHERE api_login_id = %s
+                    """,
+                    [api_login_id],
+                )
+            self._set_state(api_login_id, "open", 0)
+            raise TaxCloudUnavailable("TaxCloud is still unreachable") from error
+        self._record_success(api_login_id)
+
+    @api.model
+    def _guard(self, request, func, *args, **kwargs):
+        """Call ``func`` unless the breaker of the request's API login is open."""
+        api_login_id = request.api_login_id or ""
+        state, _failure_count = self._get_state(api_login_id)
+        if state != "closed":
+            # Another worker may have closed it since it was cached.
+            state, _failure_count = self._get_state(api_login_id, refresh=True)
+        if state != "closed":
+            probe_timeout = sum(request.timeout)
+            if not self._try_half_open(api_login_id, probe_timeout):
+                raise TaxCloudUnavailable("TaxCloud circuit breaker is open")
+            self._probe(request, api_login_id)
+        try:
+            result = func(*args, **kwargs)
+        except OSError:
+            self._record_failure(api_login_id)
+            raise
+        self._record_success(api_login_id)
+        return result
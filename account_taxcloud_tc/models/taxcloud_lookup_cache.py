@@ -0,0 +1,145 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from psycopg2 import errors
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Hits are counted in memory and written by batch, from a separate cursor,
+# so that cache reads never lock a row of a shared entry.
+HIT_FLUSH_INTERVAL = 60
+
+
+class TaxCloudLookupCache(models.Model):
+    """LookupForDate results shared by all workers, for quote-time lookups.
+
+    The key leaves out the cart and customer ids: two quotations with the
+    same lines, addresses, exemption and date share the same entry.
+    Invoices still call LookupForDate, as they need a registered cart.
+    """
+
+    _name = "taxcloud.lookup.cache"
+    _inherit = "taxcloud.cache.mixin"
+    _description = "TaxCloud Lookup Result Cache"
+    _rec_name = "fingerprint"
+
+    tax_values = fields.Json(readonly=True)
+    hit_count = fields.Integer(readonly=True)
+    miss_count = fields.Integer(readonly=True)
+    last_hit_date = fields.Datetime(readonly=True)
+
+    _sql_constraints = [
+        (
+            "fingerprint_unique",
+            "UNIQUE(fingerprint)",
+            "A lookup can only be cached once.",
+        ),
+    ]
+
+    _hits_lock = threading.Lock()
+    _pending_hits = Counter()
+    _last_hit_flush = time.monotonic()
+
+    @api.model
+    def _get(self, fingerprint):
+        """Return the cached ``{cart item index: tax amount}`` dict,
+        or None if there is no valid entry."""
+        self.env.cr.execute(
+            """
+            SELECT tax_values
+              FROM taxcloud_lookup_cache
+             WHERE fingerprint = %s
+               AND expiry_date > NOW() AT TIME ZONE 'UTC'
+            """,
+            [fingerprint],
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        self._count_hit(fingerprint)
+        return {int(index): amount for index, amount in (row[0] or {}).items()}
+
+    @api.model
+    def _store(self, fingerprint, tax_values):
+        ttl = timedelta(hours=self._get_param("lookup_cache_ttl_hours", 24))
+        self._execute_best_effort(
+            """
+            INSERT INTO taxcloud_lookup_cache
+                (fingerprint, tax_values, expiry_date, hit_count, miss_count,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, 0, 1,
+                    %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (fingerprint) DO UPDATE
+               SET tax_values = EXCLUDED.tax_values,
+                   expiry_date = EXCLUDED.expiry_date,
+                   miss_count = taxcloud_lookup_cache.miss_count + 1,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            [
+                fingerprint,
+                json.dumps(tax_values),
+                fields.Datetime.now() + ttl,
+                self.env.uid,
+                self.env.uid,
+            ],
+        )
+
+    @api.model
+    def _count_hit(self, fingerprint):
+        cls = type(self)
+        with cls._hits_lock:
+            cls._pending_hits[fingerprint] += 1
+            if time.monotonic() - cls._last_hit_flush < HIT_FLUSH_INTERVAL:
+                return
+            pending_hits, cls._pending_hits = cls._pending_hits, Counter()
+            cls._last_hit_flush = time.monotonic()
+        self._flush_hits(pending_hits)
+
+    @api.model
+    def _flush_hits(self, pending_hits):
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute(
+                    """
+                    UPDATE taxcloud_lookup_cache cache
+                       SET hit_count = cache.hit_count + hits.count,
+                           last_hit_date = NOW() AT TIME ZONE 'UTC'
+                      FROM (SELECT unnest(%s::varchar[]) AS fingerprint,
+                                   unnest(%s::int[]) AS count) hits
+                     WHERE cache.fingerprint = hits.fingerprint
+                    """,
+                    [list(pending_hits), list(pending_hits.values())],
+                )
+        except errors.SerializationFailure:
+            _logger.debug("concurrent update of the TaxCloud lookup cache hits")
+
+    @api.model
+    def _gc_expired(self):
+        super()._gc_expired()
+        # Size bound: evict the least recently used entries.
+        max_entries = self._get_param("lookup_cache_max_entries", 100000)
+        self.env.cr.execute(
+            """
+            DELETE FROM taxcloud_lookup_cache
+             WHERE id IN (
+                 SELECT id
+                   FROM taxcloud_lookup_cache
+               ORDER BY COALESCE(last_hit_date, create_date) DESC
+                 OFFSET %s
+             )
+            """,
+            [max_entries],
+        )
+        if self.env.cr.rowcount:
+            _logger.info(
+                "evicted %s TaxCloud lookup cache entries above the %s limit",
+                self.env.cr.rowcount,
+                max_entries,
+            )
@@ -0,0 +1,254 @@
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import pytz
+
+from odoo import api, fields, models
+from odoo.exceptions import UserError
+
+from .taxcloud_request import RETRY_POLICIES, is_unsent_error
+
+_logger = logging.getLogger(__name__)
+
+# Outbox operation: TaxCloud SOAP operation
+OPERATIONS = {
+    "authorized_with_capture": "AuthorizedWithCapture",
+    "captured": "Captured",
+    "returned": "Returned",
+}
+
+
+class TaxCloudOutbox(models.Model):
+    """TaxCloud write calls queued by the posting and payment transactions.
+
+    Entries are created in the business transaction, so that a rollback
+    discards the call as well. A cron sends them afterwards with bounded
+    concurrency, retries connection failures with exponential backoff and
+    moves the entries that cannot succeed to the ``dead`` state, to be
+    checked and retried by hand.
+
+    The idempotency key is unique per move and operation: queuing the same
+    call twice is a no-op. Since TaxCloud identifies orders by their move
+    id, a retried AuthorizedWithCapture or Captured answered with "already
+    done" is a success; Returned is not idempotent, so an entry whose call
+    may have reached TaxCloud is never retried automatically.
+    """
+
+    _name = "taxcloud.outbox"
+    _description = "TaxCloud Outbox"
+    _order = "id"
+    _rec_name = "idempotency_key"
+
+    move_id = fields.Many2one(
+        "account.move", required=True, readonly=True, index=True, ondelete="cascade"
+    )
+    company_id = fields.Many2one(related="move_id.company_id")
+    operation = fields.Selection(
+        [
+            ("authorized_with_capture", "Authorize with Capture"),
+            ("captured", "Capture"),
+            ("returned", "Return"),
+        ],
+        required=True,
+        readonly=True,
+    )
+    idempotency_key = fields.Char(required=True, readonly=True)
+    reporting_date = fields.Datetime(readonly=True)
+    # Timezone the reporting date was computed in, so that TaxCloud gets the
+    # same day whatever the timezone of the user running the cron.
+    reporting_tz = fields.Char(readonly=True)
+    state = fields.Selection(
+        [("pending", "Pending"), ("done", "Done"), ("dead", "Failed")],
+        required=True,
+        default="pending",
+        readonly=True,
+        index=True,
+    )
+    attempt_count = fields.Integer(readonly=True)
+    next_attempt_date = fields.Datetime(
+        required=True, default=fields.Datetime.now, readonly=True
+    )
+    last_error = fields.Text(readonly=True)
+
+    _sql_constraints = [
+        (
+            "idempotency_key_unique",
+            "UNIQUE(idempotency_key)",
+            "This TaxCloud call is already queued.",
+        ),
+    ]
+
+    @api.model
+    def _enqueue(self, move, operation, reporting_date=None, next_attempt_date=None):
+        key = "%s:%s" % (operation, move.id)
+        entry = self.search([("idempotency_key", "=", key)], limit=1)
+        if entry:
+            return entry
+        return self.create(
+            {
+                "move_id": move.id,
+                "operation": operation,
+                "idempotency_key": key,
+                "reporting_date": reporting_date,
+                "reporting_tz": reporting_date and move._get_taxcloud_reporting_tz(),
+                "next_attempt_date": next_attempt_date or fields.Datetime.now(),
+            }
+        )
+
+    def action_retry(self):
+        self.write(
+            {
+                "state": "pending",
+                "attempt_count": 0,
+                "next_attempt_date": fields.Datetime.now(),
+            }
+        )
+
+    @api.model
+    def _get_param(self, key, default):
+        return int(
+            self.env["ir.config_parameter"].sudo().get_param(
+                "account_taxcloud_tc.%s" % key, default
+            )
+        )
+
+    @api.model
+    def _lock_due(self, limit):
+        # Entries of a move are sent in order: a Captured call waits for the
+        # AuthorizedWithCapture queued before it, until it is done. A failed
+        # entry holds back the next ones until it is retried.
+        self.env.cr.execute(
+            """
+            SELECT entry.id
+              FROM taxcloud_outbox entry
+             WHERE entry.state = 'pending'
+               AND entry.next_attempt_date <= NOW() AT TIME ZONE 'UTC'
+               AND NOT EXISTS (
+                   SELECT 1
+                     FROM taxcloud_outbox prior
+                    WHERE prior.move_id = entry.move_id
+                      AND prior.id < entry.id
+                      AND prior.state IN ('pending', 'dead')
+               )
+          ORDER BY entry.next_attempt_date, entry.id
+             LIMIT %s
+               FOR UPDATE OF entry SKIP LOCKED
+            """,
+            [limit],
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_process(self, limit=100):
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        while True:
+            entries = self._lock_due(limit)
+            if not entries:
+                break
+            entries._process()
+            if not auto_commit:
+                break
+            self.env.cr.commit()
+
+    def _process(self):
+        concurrency = max(self._get_param("outbox_concurrency", 4), 1)
+        calls = {}
+        for entry in self:
+            try:
+                calls[entry] = entry._prepare_call()
+            except UserError as error:
+                entry._set_dead(str(error))
+        # The retries of the whole batch share one deadline.
+        batch_deadline = self._get_param("batch_deadline", 120)
+        for request, _method, _args in calls.values():
+            request.set_deadline(batch_deadline)
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="taxcloud"
+        ) as executor:
+            futures = {
+                executor.submit(method, *args): (entry, request)
+                for entry, (request, method, args) in calls.items()
+            }
+            for future in as_completed(futures):
+                entry, request = futures[future]
+                try:
+                    response = future.result()
+                except OSError as error:
+                    entry._handle_failure(error)
+                else:
+                    entry._handle_response(request, response)
+
+    def _prepare_call(self):
+        """Return the ``(request, method, args)`` call of the entry."""
+        self.ensure_one()
+        move = self.move_id
+        company = move.company_id
+        request = move._get_TaxCloudRequest(
+            company.taxcloud_api_id, company.taxcloud_api_key
+        )
+        request.set_connection_detail(company)
+        if self.operation == "captured":
+            # Captured only sends the order id.
+            return request, request.get_taxcloud_captured, (move,)
+        request.set_invoice_items_detail(move)
+        if self.operation == "authorized_with_capture":
+            reporting_date = pytz.utc.localize(self.reporting_date).astimezone(
+                pytz.timezone(self.reporting_tz or "UTC")
+            )
+            return (
+                request,
+                request.get_taxcloud_authorize_with_capture,
+                (move, reporting_date),
+            )
+        return (
+            request,
+            request.get_taxcloud_returned,
+            (move.reversed_entry_id, move.invoice_date),
+        )
+
+    def _handle_response(self, request, response):
+        policy = RETRY_POLICIES[OPERATIONS[self.operation]]
+        if response.ResponseType == "Error" and not (
+            policy.duplicate and request._is_duplicate(policy, response)
+        ):
+            self._set_dead(response.Messages.ResponseMessage[0].Message)
+            return
+        self.write({"state": "done", "last_error": False})
+
+    def _handle_failure(self, error):
+        policy = RETRY_POLICIES[OPERATIONS[self.operation]]
+        if not (policy.duplicate or is_unsent_error(error)):
+            self._set_dead(
+                self.env._(
+                    "%(error)s\nThe call may have reached TaxCloud: check the "
+                    "transaction on TaxCloud before retrying it.",
+                    error=error,
+                )
+            )
+            return
+        attempt_count = self.attempt_count + 1
+        if attempt_count >= self._get_param("outbox_max_attempts", 8):
+            self._set_dead(str(error))
+            return
+        # Exponential backoff with jitter, capped at one hour.
+        delay = min(60 * 2**attempt_count, 3600) * random.uniform(0.5, 1)
+        self.write(
+            {
+                "attempt_count": attempt_count,
+                "next_attempt_date": fields.Datetime.now() + timedelta(seconds=delay),
+                "last_error": str(error),
+            }
+        )
+
+    def _set_dead(self, error):
+        _logger.warning("TaxCloud outbox entry %s failed: %s", self.idempotency_key, error)
+        self.write(
+            {
+                "state": "dead",
+                "attempt_count": self.attempt_count + 1,
+                "last_error": error,
+            }
+        )
@@ -0,0 +1,250 @@
+import datetime
+import logging
+import re
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+
+from .taxcloud_request import make_fingerprint
+
+_logger = logging.getLogger(__name__)
+
+
+class TaxCloudRate(models.Model):
+    """Effective tax rate per (origin, destination ZIP+4, TIC, exemption
+    certificate, month), used to compute quotation taxes without calling
+    TaxCloud. Entries are filled from regular lookups and from single-item
+    probes, and expire at the end of their month.
+    """
+
+    _name = "taxcloud.rate"
+    _inherit = "taxcloud.cache.mixin"
+    _description = "TaxCloud Jurisdiction Rate"
+    _rec_name = "fingerprint"
+
+    origin_zip = fields.Char(readonly=True)
+    destination_zip = fields.Char(readonly=True, index=True)
+    tic_code = fields.Char(string="TIC", readonly=True)
+    exemption_certificate = fields.Char(readonly=True)
+    date_bucket = fields.Date(readonly=True)
+    rate = fields.Float(digits=(16, 6), readonly=True)
+    source = fields.Selection(
+        [("lookup", "Lookup"), ("probe", "Probe")], readonly=True
+    )
+
+    _sql_constraints = [
+        (
+            "fingerprint_unique",
+            "UNIQUE(fingerprint)",
+            "A rate can only be stored once per jurisdiction, TIC and period.",
+        ),
+    ]
+
+    @api.model
+    def _get_zip(self, address):
+        return "%s-%s" % (address.Zip5 or "", address.Zip4 or "")
+
+    @api.model
+    def _get_date_bucket(self, request):
+        date = getattr(request, "taxcloud_date", None) or fields.Date.today()
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        return date.replace(day=1)
+
+    @api.model
+    def _get_key_values(self, request, tic_code):
+        exemption_certificate = getattr(
+            request.ExemptionCertificate, "CertificateID", None
+        )
+        return {
+            "origin_zip": self._get_zip(request.origin),
+            "destination_zip": self._get_zip(request.destination),
+            "tic_code": str(tic_code if tic_code is not None else ""),
+            "exemption_certificate": exemption_certificate or "",
+            "date_bucket": self._get_date_bucket(request),
+        }
+
+    @api.model
+    def _get_key(self, request, key_values):
+        return make_fingerprint(
+            request.api_login_id or "",
+            key_values["origin_zip"],
+            key_values["destination_zip"],
+            key_values["tic_code"],
+            key_values["exemption_certificate"],
+            fields.Date.to_string(key_values["date_bucket"]),
+        )
+
+    @api.model
+    def _get_item_keys(self, request):
+        """Return ``{tic code: fingerprint}`` for the request cart items."""
+        keys = {}
+        for item in request.cart_items.CartItem:
+            if item.TIC not in keys:
+                keys[item.TIC] = self._get_key(
+                    request, self._get_key_values(request, item.TIC)
+                )
+        return keys
+
+    @api.model
+    def _get_rates(self, fingerprints):
+        if not fingerprints:
+            return {}
+        self.env.cr.execute(
+            """
+            SELECT fingerprint, rate
+              FROM taxcloud_rate
+             WHERE fingerprint IN %s
+               AND expiry_date > NOW() AT TIME ZONE 'UTC'
+            """,
+            [tuple(fingerprints)],
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_missing_tic_codes(self, request):
+        keys = self._get_item_keys(request)
+        rates = self._get_rates(set(keys.values()))
+        return [tic_code for tic_code, key in keys.items() if key not in rates]
+
+    @api.model
+    def _compute_tax_values(self, request):
+        """Compute the LookupForDate-like ``{index: tax amount}`` dict from
+        the matrix, or return None if any cart item has no known rate."""
+        items = request.cart_items.CartItem
+        if not items:
+            return None
+        keys = self._get_item_keys(request)
+        rates = self._get_rates(set(keys.values()))
+        if len(rates) != len(set(keys.values())):
+            return None
+        return {
+            item.Index: item.Price * item.Qty * rates[keys[item.TIC]] / 100
+            for item in items
+        }
+
+    @api.model
+    def _store_rate(self, request, tic_code, rate, source):
+        key_values = self._get_key_values(request, tic_code)
+        expiry_date = datetime.datetime.combine(
+            key_values["date_bucket"] + relativedelta(months=1), datetime.time.min
+        )
+        self._execute_best_effort(
+            """
+            INSERT INTO taxcloud_rate
+                (fingerprint, origin_zip, destination_zip, tic_code,
+                 exemption_certificate, date_bucket, rate, source, expiry_date,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (fingerprint) DO UPDATE
+               SET rate = EXCLUDED.rate,
+                   source = EXCLUDED.source,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            [
+                self._get_key(request, key_values),
+                key_values["origin_zip"],
+                key_values["destination_zip"],
+                key_values["tic_code"],
+                key_values["exemption_certificate"],
+                key_values["date_bucket"],
+                rate,
+                source,
+                expiry_date,
+                self.env.uid,
+                self.env.uid,
+            ],
+        )
+
+    @api.model
+    def _store_from_lookup(self, request, tax_values):
+        """Derive the rates from the amounts TaxCloud returned for a cart."""
+        stored = set()
+        for item in request.cart_items.CartItem:
+            amount = item.Price * item.Qty
+            if item.TIC in stored or item.Index not in tax_values or amount <= 0:
+                continue
+            self._store_rate(
+                request, item.TIC, tax_values[item.Index] / amount * 100, "lookup"
+            )
+            stored.add(item.TIC)
+
+    @api.model
+    def _probe(self, request, product_id, tic_code):
+        """Fill one entry with a single $100 item lookup.
+        This replaces the cart of ``request``."""
+        request.set_items_detail(product_id, tic_code)
+        response = request.get_all_taxes_values()
+        if response.get("error_message"):
+            _logger.info(
+                "TaxCloud rate probe failed for TIC %s: %s",
+                tic_code,
+                response["error_message"],
+            )
+            return False
+        # The probe sends a single $100 item, so the tax amount is the rate.
+        rate = sum(response["values"].values())
+        self._store_rate(request, tic_code, rate, "probe")
+        return True
+
+    @api.model
+    def _get_destination_zip5(self, request):
+        try:
+            return request.destination.Zip5
+        except OSError:
+            # TaxCloud is unreachable and the address is not cached yet.
+            partner = request._destination_partner
+            zip_match = re.match(r"^\D*(\d{5})", partner and partner.zip or "")
+            return zip_match and zip_match.group(1)
+
+    @api.model
+    def _compute_estimated_tax_values(self, request):
+        """Estimate the taxes from the most recent known rate for the same
+        destination ZIP code and TIC, expired or not. Used when TaxCloud is
+        unreachable; return None if any cart item has no known rate."""
+        items = request.cart_items.CartItem
+        zip5 = self._get_destination_zip5(request)
+        if not items or not zip5:
+            return None
+        exemption_certificate = getattr(
+            request.ExemptionCertificate, "CertificateID", None
+        )
+        tic_codes = {str(item.TIC if item.TIC is not None else "") for item in items}
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (tic_code) tic_code, rate
+              FROM taxcloud_rate
+             WHERE destination_zip LIKE %s
+               AND tic_code IN %s
+               AND exemption_certificate = %s
+          ORDER BY tic_code, date_bucket DESC, write_date DESC
+            """,
+            [zip5 + "-%", tuple(tic_codes), exemption_certificate or ""],
+        )
+        rates = dict(self.env.cr.fetchall())
+        if len(rates) != len(tic_codes):
+            return None
+        return {
+            item.Index: item.Price
+            * item.Qty
+            * rates[str(item.TIC if item.TIC is not None else "")]
+            / 100
+            for item in items
+        }
+
+    @api.model
+    def _gc_expired(self):
+        # Expired rates are kept for a while: they are the fallback used to
+        # estimate taxes while TaxCloud is unreachable.
+        retention = self._get_param("rate_retention_days", 90)
+        self.env.cr.execute(
+            """
+            DELETE FROM taxcloud_rate
+             WHERE expiry_date <= NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 day'
+            """,
+            [retention],
+        )
+        _logger.info("removed %s expired TaxCloud rates", self.env.cr.rowcount)
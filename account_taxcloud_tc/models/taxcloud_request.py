@@ -1,8 +1,16 @@
 import hashlib
 import logging
+import os
+import random
 import re
+import threading
+import time
+from collections import namedtuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from zeep.transports import Transport
 
 from odoo import fields, modules
 from odoo.tools import LazyTranslate
@@ -14,26 +22,280 @@ _lt = LazyTranslate(__name__)
 _logger = logging.getLogger(__name__)
 
 
-class TaxCloudRequest:
-    """Low-level object intended to interface Odoo recordsets with TaxCloud,
-    through appropriate SOAP requests"""
+# HTTP settings shared by the REST (VerifyAddress) and SOAP calls.
+# Timeouts are expressed in seconds.
+TaxCloudConnectionProfile = namedtuple(
+    "TaxCloudConnectionProfile",
+    ["pool_size", "connect_timeout", "read_timeout", "use_gzip"],
+)
+DEFAULT_CONNECTION_PROFILE = TaxCloudConnectionProfile(10, 10, 60, True)
 
-    def __init__(self, api_id, api_key):
+# Retry budget of each TaxCloud operation. Read-only operations are retried
+# after any connection failure or timeout. Write operations are retried
+# after a failure that may have reached TaxCloud only if ``duplicate``
+# matches the error TaxCloud answers when the first attempt went through;
+# otherwise they are only retried when the request was provably never sent.
+RetryPolicy = namedtuple("RetryPolicy", ["attempts", "read_only", "duplicate"])
+RETRY_POLICIES = {
+    "LookupForDate": RetryPolicy(3, True, None),
+    "GetTICs": RetryPolicy(3, True, None),
+    "GetExemptCertificates": RetryPolicy(3, True, None),
+    "VerifyAddress": RetryPolicy(3, True, None),
+    "AuthorizedWithCapture": RetryPolicy(3, False, re.compile(r"already", re.I)),
+    "Captured": RetryPolicy(3, False, re.compile(r"already", re.I)),
+    "DeleteExemptCertificate": RetryPolicy(
+        2, False, re.compile(r"not found|does not exist", re.I)
+    ),
+    "Returned": RetryPolicy(2, False, None),
+    "AddExemptCertificate": RetryPolicy(2, False, None),
+    "AddTransactions": RetryPolicy(3, False, re.compile(r"already", re.I)),
+}
+DEFAULT_RETRY_POLICY = RetryPolicy(1, False, None)
+
+
+# Timeout of the TaxCloud call in progress in the current thread: the read
+# timeout is lowered by ``TaxCloudRequest._retry`` to what is left of its
+# deadline.
+_call_timeout = threading.local()
+
+
+def get_call_timeout(default):
+    return getattr(_call_timeout, "value", None) or default
+
+
+class TaxCloudTransport(Transport):
+    """Zeep transport sending the SOAP calls with the timeout of the call
+    in progress, see ``get_call_timeout``."""
+
+    def post(self, address, message, headers):
+        timeout = getattr(_call_timeout, "value", None)
+        if timeout is None:
+            return super().post(address, message, headers)
+        return self.session.post(
+            address, data=message, headers=headers, timeout=timeout
+        )
+
+
+class TaxCloudUnavailable(OSError):
+    """Raised without calling TaxCloud while the circuit breaker is open.
+    As an OSError, it is reported like any other connection failure."""
+
+
+def is_unsent_error(error):
+    """Whether ``error`` happened before the request reached TaxCloud."""
+    if isinstance(error, (TaxCloudUnavailable, requests.exceptions.ConnectTimeout)):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+def make_fingerprint(*parts):
+    """Digest of a tuple of primitives (str, int, float, None and nested
+    tuples), used as key by every TaxCloud cache layer."""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=20).hexdigest()
+
+
+class TaxCloudClientRegistry:
+    """Per-worker registry of compiled TaxCloud SOAP clients.
+
+    Parsing the WSDL is expensive, so the zeep client and its type factory
+    are built once per process and shared by every :class:`TaxCloudRequest`.
+    Each connection profile gets its own keep-alive ``requests.Session``,
+    used both as the zeep transport and for the REST VerifyAddress calls,
+    so that consecutive calls reuse the same TLS connections.
+    The registry is reset when the process id changes, so that forked
+    workers never reuse objects (or sockets) created by their parent.
+    """
+
+    _lock = threading.Lock()
+    _clients = {}
+    _pid = None
+
+    @classmethod
+    def get(cls, profile=DEFAULT_CONNECTION_PROFILE):
+        """Return the ``(client, factory, session)`` triple registered for
+        ``profile``, building it on first use."""
+        entry = cls._clients.get(profile) if cls._pid == os.getpid() else None
+        if entry is None:
+            with cls._lock:
+                if cls._pid != os.getpid():
+                    cls._clients = {}
+                    cls._pid = os.getpid()
+                entry = cls._clients.get(profile)
+                if entry is None:
+                    entry = cls._build(profile)
+                    cls._clients[profile] = entry
+        return entry
+
+    @classmethod
+    def _build(cls, profile):
         wsdl_path = (
             modules.get_module_path("account_taxcloud_tc") + "/api/taxcloud.wsdl"
         )
-        self.client = Client("file:///%s" % wsdl_path)
-        self.factory = self.client.type_factory("ns0")
+        _logger.debug("building TaxCloud SOAP client %s from %s", profile, wsdl_path)
+        session = cls._build_session(profile)
+        transport = TaxCloudTransport(
+            session=session,
+            operation_timeout=(profile.connect_timeout, profile.read_timeout),
+        )
+        client = Client("file:///%s" % wsdl_path, transport=transport)
+        return client, client.type_factory("ns0"), session
+
+    @classmethod
+    def _build_session(cls, profile):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=profile.pool_size,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept-Encoding"] = (
+            "gzip, deflate" if profile.use_gzip else "identity"
+        )
+        return session
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            for _client, _factory, session in cls._clients.values():
+                session.close()
+            cls._clients = {}
+
+
+class TaxCloudRequest:
+    """Low-level object intended to interface Odoo recordsets with TaxCloud,
+    through appropriate SOAP requests.
+
+    Request objects are cheap: the SOAP client and type factory are shared
+    through :class:`TaxCloudClientRegistry`, only the per-call state (cart,
+    addresses, credentials) lives on the instance.
+    """
+
+    # ``taxcloud.circuit.breaker`` model guarding the calls, if any
+    circuit_breaker = None
+    # Retry settings, see ``set_connection_detail``. Delays in seconds.
+    retry_max_attempts = 3
+    retry_base_delay = 0.5
+    retry_max_delay = 4.0
+    retry_deadline = 30.0
+    # Monotonic time after which no retry is attempted, shared by all the
+    # calls of the request; see ``set_deadline``.
+    deadline = None
+
+    def __init__(self, api_id, api_key):
+        self._set_connection_profile(DEFAULT_CONNECTION_PROFILE)
         self.api_login_id = api_id
         self.api_key = api_key
         self.ExemptionCertificate = None
+        # {line id: cart index} of the lines sent, see ``_process_lines``
+        self.cart_line_indexes = {}
 
-    def verify_address(self, partner):
-        # Ensure that the partner address is as
-        # accurate as possible (with zip4 field for example)
+    def _set_connection_profile(self, profile):
+        self.connection_profile = profile
+        self.timeout = (profile.connect_timeout, profile.read_timeout)
+        self.client, self.factory, self.session = TaxCloudClientRegistry.get(profile)
+
+    def set_connection_detail(self, company):
+        """Use the HTTP pool and timeouts configured on ``company``.
+        Must be called before any zeep object is built on this request."""
+        self._set_connection_profile(
+            TaxCloudConnectionProfile(
+                max(company.taxcloud_pool_size, 1),
+                max(company.taxcloud_connect_timeout, 1),
+                max(company.taxcloud_read_timeout, 1),
+                bool(company.taxcloud_use_gzip),
+            )
+        )
+        self.circuit_breaker = company.env["taxcloud.circuit.breaker"].sudo()
+        get_param = company.env["ir.config_parameter"].sudo().get_param
+        self.retry_max_attempts = int(
+            get_param("account_taxcloud_tc.retry_max_attempts", 3)
+        )
+        self.retry_base_delay = float(
+            get_param("account_taxcloud_tc.retry_base_delay", 0.5)
+        )
+        self.retry_max_delay = float(get_param("account_taxcloud_tc.retry_max_delay", 4))
+        self.retry_deadline = float(get_param("account_taxcloud_tc.retry_deadline", 30))
+
+    def set_deadline(self, seconds):
+        """Stop retrying the calls of this request ``seconds`` from now,
+        e.g. to bound the time spent on a whole batch of invoices."""
+        self.deadline = time.monotonic() + seconds
+
+    def _guarded(self, func, *args, **kwargs):
+        if self.circuit_breaker is None:
+            return func(*args, **kwargs)
+        return self.circuit_breaker._guard(self, func, *args, **kwargs)
+
+    def _get_retry_delay(self, attempt):
+        # Exponential backoff with full jitter.
+        return random.uniform(
+            0, min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+        )
+
+    def _retry(self, operation, func, *args, **kwargs):
+        """Call ``func`` through the circuit breaker, retrying transient
+        failures according to the ``RETRY_POLICIES`` of ``operation``."""
+        policy = RETRY_POLICIES.get(operation, DEFAULT_RETRY_POLICY)
+        attempts = max(min(policy.attempts, self.retry_max_attempts), 1)
+        deadline = time.monotonic() + self.retry_deadline
+        if self.deadline is not None:
+            deadline = min(deadline, self.deadline)
+        attempt = 0
+        while True:
+            # An attempt cannot outlast the deadline.
+            connect_timeout, read_timeout = self.timeout
+            _call_timeout.value = (
+                connect_timeout,
+                max(min(read_timeout, deadline - time.monotonic()), 1),
+            )
+            try:
+                result = self._guarded(func, *args, **kwargs)
+            except OSError as error:
+                attempt += 1
+                sent = not is_unsent_error(error)
+                retriable = (
+                    attempt < attempts
+                    and not isinstance(error, TaxCloudUnavailable)
+                    and (policy.read_only or policy.duplicate or not sent)
+                )
+                delay = self._get_retry_delay(attempt)
+                if not retriable or time.monotonic() + delay >= deadline:
+                    raise
+                _logger.info(
+                    "TaxCloud %s failed (%s), retry %s/%s in %.1fs",
+                    operation,
+                    error,
+                    attempt,
+                    attempts - 1,
+                    delay,
+                )
+                time.sleep(delay)
+                continue
+            finally:
+                _call_timeout.value = None
+            if attempt and policy.duplicate and self._is_duplicate(policy, result):
+                # The previous attempt went through, only its answer was lost.
+                _logger.info("TaxCloud %s already applied, ignoring %s", operation, result)
+                result.ResponseType = "OK"
+            return result
+
+    def _is_duplicate(self, policy, response):
+        if getattr(response, "ResponseType", None) != "Error":
+            return False
+        messages = response.Messages and response.Messages.ResponseMessage or []
+        return any(policy.duplicate.search(message.Message or "") for message in messages)
+
+    def _call(self, operation, *args):
+        """Call the SOAP ``operation`` through the circuit breaker,
+        with retries."""
+        return self._retry(operation, getattr(self.client.service, operation), *args)
+
+    def _get_address_to_verify(self, partner):
         zip_match = re.match(r"^\D*(\d{5})\D*(\d{4})?", partner.zip or "")
         zips = list(zip_match.groups()) if zip_match else []
-        address_to_verify = {
+        return {
             "apiLoginID": self.api_login_id,
             "apiKey": self.api_key,
             "Address1": partner.street or "",
@@ -43,40 +305,113 @@ class TaxCloudRequest:
             "Zip5": zips.pop(0) if zips else "",
             "Zip4": zips.pop(0) if zips else "",
         }
-        res = requests.post(
-            "https://api.taxcloud.com/1.0/TaxCloud/VerifyAddress",
-            data=address_to_verify,
-            timeout=60,
-        ).json()
-        if int(res.get("ErrNumber", False)):
-            # If VerifyAddress fails, use Lookup with the initial address
+
+    def verify_address(self, partner):
+        # Ensure that the partner address is as
+        # accurate as possible (with zip4 field for example)
+        address_to_verify = self._get_address_to_verify(partner)
+        AddressCache = partner.env["taxcloud.address.cache"].sudo()
+        fingerprint = AddressCache._fingerprint(address_to_verify)
+        cached_address = AddressCache._get(fingerprint)
+        if cached_address is not None:
+            return cached_address
+        res, verified = self._verify_address_remote(address_to_verify)
+        if not verified:
             _logger.info(
                 "Could not verify address for partner #%s"
                 " using taxcloud; using unverified address instead",
                 partner.id,
             )
-            res.update(address_to_verify)
+        AddressCache._store(fingerprint, res, verified)
         return res
 
+    def _verify_address_remote(self, address_to_verify):
+        """Call VerifyAddress without using the environment cursor, so that
+        it can run in a thread. Return the ``(address, verified)`` pair."""
+        res = self._retry(
+            "VerifyAddress", self._post_verify_address, address_to_verify
+        ).json()
+        verified = not int(res.get("ErrNumber", False))
+        if not verified:
+            # If VerifyAddress fails, use Lookup with the initial address
+            res.update(address_to_verify)
+        return res, verified
+
+    def _post_verify_address(self, address_to_verify):
+        return self.session.post(
+            "https://api.taxcloud.com/1.0/TaxCloud/VerifyAddress",
+            data=address_to_verify,
+            timeout=get_call_timeout(self.timeout),
+        )
+
+    # Addresses are verified lazily, on first access of ``origin`` or
+    # ``destination``, so that the request can be hashed (and looked up in
+    # caches) without any VerifyAddress round trip.
+    _origin_partner = None
+    _destination_partner = None
+    _origin = None
+    _destination = None
+
     def set_location_origin_detail(self, shipper):
-        address = self.verify_address(shipper)
-        self.origin = self.factory.Address()
-        self.origin.Address1 = address["Address1"] or ""
-        self.origin.Address2 = address["Address2"] or ""
-        self.origin.City = address["City"]
-        self.origin.State = address["State"]
-        self.origin.Zip5 = address["Zip5"]
-        self.origin.Zip4 = address["Zip4"]
+        self._origin_partner = shipper
+        self._origin = None
 
     def set_location_destination_detail(self, recipient_partner):
-        address = self.verify_address(recipient_partner)
-        self.destination = self.factory.Address()
-        self.destination.Address1 = address["Address1"] or ""
-        self.destination.Address2 = address["Address2"] or ""
-        self.destination.City = address["City"]
-        self.destination.State = address["State"]
-        self.destination.Zip5 = address["Zip5"]
-        self.destination.Zip4 = address["Zip4"]
+        self._destination_partner = recipient_partner
+        self._destination = None
+
+    @property
+    def origin(self):
+        if self._origin is None and self._origin_partner is not None:
+            self._origin = self._get_verified_address(self._origin_partner)
+        return self._origin
+
+    @origin.setter
+    def origin(self, address):
+        self._origin = address
+
+    @property
+    def destination(self):
+        if self._destination is None and self._destination_partner is not None:
+            self._destination = self._get_verified_address(self._destination_partner)
+        return self._destination
+
+    @destination.setter
+    def destination(self, address):
+        self._destination = address
+
+    def _get_verified_address(self, partner):
+        address = self.verify_address(partner)
+        verified_address = self.factory.Address()
+        verified_address.Address1 = address["Address1"] or ""
+        verified_address.Address2 = address["Address2"] or ""
+        verified_address.City = address["City"]
+        verified_address.State = address["State"]
+        verified_address.Zip5 = address["Zip5"]
+        verified_address.Zip4 = address["Zip4"]
+        return verified_address
+
+    def _get_address_key(self, partner, address, include_ids=True):
+        """Cache key part for an address: the raw partner fields (and their
+        write_date), so that no network call is needed to compute it.
+        Falls back on the address itself when it was set directly."""
+        if partner is None:
+            if address is None:
+                return None
+            return tuple(
+                str(address[k] or "")
+                for k in ("Address1", "Address2", "City", "State", "Zip5", "Zip4")
+            )
+        key = (
+            partner.street or "",
+            partner.street2 or "",
+            partner.city or "",
+            partner.state_id.code or "",
+            partner.zip or "",
+        )
+        if include_ids:
+            key += (partner.id, str(partner.write_date))
+        return key
 
     def set_items_detail(self, product_id, tic_code):
         self.cart_items = self.factory.ArrayOfCartItem()
@@ -98,42 +433,49 @@ class TaxCloudRequest:
         self.cart_items.CartItem = self._process_lines(invoice.invoice_line_ids)
 
     def _process_lines(self, lines):
+        """Return the cart items of ``lines``, in a single pass.
+
+        The cart index of each line sent is kept in ``cart_line_indexes``
+        (``{line id: index}``), to set the taxes of the response back on the
+        lines. Notes, sections, negative lines and, depending on the company
+        settings, zero lines are not sent.
+        """
         cart_items = []
-        for index, line in enumerate(
-            lines.filtered(
-                lambda x: x.display_type not in ("line_note", "line_section")
-            )
-        ):
+        self.cart_line_indexes = {}
+        lines = lines.filtered(
+            lambda x: x.display_type not in ("line_note", "line_section")
+        )
+        company = lines.env.company
+        if lines._name == "sale.order.line":
+            skip_zero = company._fields.get("is_skip_zero_orders") and company.is_skip_zero_orders
+        else:
+            skip_zero = company.is_skip_zero_invoice
+        tic_codes = lines.env["product.product"]._get_taxcloud_tic_codes(
+            set(lines.product_id.ids)
+        )
+        default_tic_category = (
+            lines.company_id[:1].tic_category_id or company.tic_category_id
+        )
+        for index, line in enumerate(lines):
             qty = line._get_qty()
-            if line._get_taxcloud_price() >= 0.0 and qty >= 0.0:
-                skip_zero_orders = False
-                if 'is_skip_zero_orders' in line.env.company._fields:
-                    skip_zero_orders = line.env.company.is_skip_zero_orders
-                skip_zero_invoice = line.env.company.is_skip_zero_invoice
-                if not line.price_subtotal and (((skip_zero_orders) and line._name == 'sale.order.line') \
-                    or ((skip_zero_invoice) and line._name == 'account.move.line')):
-                    continue
-                product_id = line.product_id.id
-                tic_category = (
-                    line.product_id.tic_category_id
-                    or line.product_id.categ_id.tic_category_id
-                    or line.company_id.tic_category_id
-                    or line.env.company.tic_category_id
-                )
-                tic_code = None
-                if tic_category:
-                    tic_code = tic_category.code
-                price_unit = line._get_taxcloud_price() * (
-                    1 - (line.discount or 0.0) / 100.0
-                )
+            price = line._get_taxcloud_price()
+            if price < 0.0 or qty < 0.0:
+                continue
+            if skip_zero and not line.price_subtotal:
+                continue
+            product_id = line.product_id.id
+            tic_code = tic_codes.get(product_id)
+            if tic_code is None and default_tic_category:
+                tic_code = default_tic_category.code
 
-                cart_item = self.factory.CartItem()
-                cart_item.Index = index
-                cart_item.ItemID = product_id
-                cart_item.TIC = tic_code
-                cart_item.Price = price_unit
-                cart_item.Qty = qty
-                cart_items.append(cart_item)
+            cart_item = self.factory.CartItem()
+            cart_item.Index = index
+            cart_item.ItemID = product_id
+            cart_item.TIC = tic_code
+            cart_item.Price = price * (1 - (line.discount or 0.0) / 100.0)
+            cart_item.Qty = qty
+            cart_items.append(cart_item)
+            self.cart_line_indexes[line.id] = index
         return cart_items
 
     def get_all_taxes_values(self):
@@ -156,7 +498,8 @@ class TaxCloudRequest:
             return formatted_response
 
         try:
-            response = self.client.service.LookupForDate(
+            response = self._call(
+                "LookupForDate",
                 self.api_login_id,
                 self.api_key,
                 customer_id,
@@ -184,13 +527,14 @@ class TaxCloudRequest:
             formatted_response["error_message"] = fault.message
         except OSError:
             formatted_response["error_message"] = "TaxCloud Server Not Found"
+            formatted_response["unreachable"] = True
         return formatted_response
 
     # Get TIC category on synchronize.
     def get_tic_category(self):
         formatted_response = {}
         try:
-            self.response = self.client.service.GetTICs(self.api_login_id, self.api_key)
+            self.response = self._call("GetTICs", self.api_login_id, self.api_key)
             if self.response.ResponseType == "OK":
                 formatted_response["data"] = self.response.TICs.TIC
             elif self.response.ResponseType == "Error":
@@ -205,7 +549,8 @@ class TaxCloudRequest:
         return formatted_response
 
     def get_taxcloud_authorize_with_capture(self, invoice_id, reporting_date):
-        return self.client.service.AuthorizedWithCapture(
+        return self._call(
+            "AuthorizedWithCapture",
             self.api_login_id,
             self.api_key,
             self.customer_id,
@@ -216,7 +561,8 @@ class TaxCloudRequest:
         )
 
     def get_taxcloud_returned(self, origin_invoice, invoice_date):
-        return self.client.service.Returned(
+        return self._call(
+            "Returned",
             self.api_login_id,
             self.api_key,
             origin_invoice.id,
@@ -225,29 +571,131 @@ class TaxCloudRequest:
         )
 
     def get_taxcloud_captured(self, invoice):
-        return self.client.service.Captured(
+        return self._call(
+            "Captured",
             self.api_login_id,
             self.api_key,
             invoice.id,
         )
 
+    def get_transaction(self, invoice):
+        """Return the AddTransactions ``Transaction`` of the posted
+        ``invoice``, with the rates of the taxes set on its lines.
+        The origin and destination must be set beforehand."""
+        self.set_invoice_items_detail(invoice)
+        line_by_index = {
+            self.cart_line_indexes[line.id]: line
+            for line in invoice.invoice_line_ids
+            if line.id in self.cart_line_indexes
+        }
+        items = self.factory.ArrayOfTransactionCartItem()
+        items.TransactionCartItem = [
+            self.factory.TransactionCartItem(
+                Index=item.Index,
+                ItemID=item.ItemID,
+                TIC=item.TIC,
+                Price=item.Price,
+                Qty=item.Qty,
+                Rate=sum(
+                    line_by_index[item.Index]
+                    .tax_ids.filtered(lambda tax: tax.amount_type == "percent")
+                    .mapped("amount")
+                )
+                / 100,
+            )
+            for item in self.cart_items.CartItem
+        ]
+        reporting_date = self.taxcloud_date
+        return self.factory.Transaction(
+            customerID=self.customer_id,
+            cartID=self.cart_id,
+            orderID=invoice.id,
+            cartItems=items,
+            origin=self.origin,
+            destination=self.destination,
+            deliveredBySeller=False,
+            exemptCert=self.ExemptionCertificate,
+            dateTransaction=reporting_date,
+            dateAuthorized=reporting_date,
+            dateCaptured=reporting_date,
+        )
+
+    def add_transactions(self, transactions):
+        formatted_response = {}
+        try:
+            transaction_array = self.factory.ArrayOfTransaction()
+            transaction_array.Transaction = transactions
+            response = self._call(
+                "AddTransactions", self.api_login_id, self.api_key, transaction_array
+            )
+            formatted_response["response"] = response
+            if response.ResponseType == "Error":
+                formatted_response["error_message"] = response.Messages.ResponseMessage[
+                    0
+                ].Message
+                formatted_response["duplicate"] = self._is_duplicate(
+                    RETRY_POLICIES["AddTransactions"], response
+                )
+        except Fault as fault:
+            formatted_response["error_message"] = fault.message
+        except OSError:
+            formatted_response["error_message"] = "TaxCloud Server Not Found"
+        return formatted_response
+
+    def _get_cart_key(self):
+        cart_items = getattr(self, "cart_items", None)
+        items = cart_items and cart_items.CartItem or []
+        return tuple(
+            sorted(
+                (
+                    item.Index,
+                    item.ItemID,
+                    item.TIC,
+                    round(item.Price or 0.0, 6),
+                    round(item.Qty or 0.0, 6),
+                )
+                for item in items
+            )
+        )
+
+    def _get_date_bucket(self):
+        taxcloud_date = getattr(self, "taxcloud_date", None) or fields.Date.today()
+        return fields.Date.to_string(taxcloud_date)
+
+    def fingerprint(self, include_ids=True):
+        """Canonical key of the request inputs.
+
+        :param include_ids: when False, the cart and customer ids (and the
+            partner ids) are left out, so that identical carts shipped to
+            identical addresses share the same key.
+        """
+        exemption_certificate = getattr(self.ExemptionCertificate, "CertificateID", None)
+        key = (
+            self.api_login_id or "",
+            self._get_cart_key(),
+            self._get_address_key(self._origin_partner, self._origin, include_ids),
+            self._get_address_key(
+                self._destination_partner, self._destination, include_ids
+            ),
+            exemption_certificate,
+            self._get_date_bucket(),
+        )
+        if include_ids:
+            key += (
+                str(getattr(self, "customer_id", None) or "NoCustomerID"),
+                str(getattr(self, "cart_id", None) or "NoCartID"),
+            )
+        return make_fingerprint(*key)
+
+    def document_fingerprint(self, taxes):
+        """Fingerprint of the request inputs and of the ``taxes`` set on the
+        document lines (tuple of tax id tuples). Stored on the document, it
+        tells whether validating it again can change anything."""
+        return make_fingerprint(self.fingerprint(), taxes)
+
     @property
     def hash(self):
         # The hash is used as key to cache request responses,
         # to avoid using too much space in the cache.
-        # The current date is appended to refresh the value every day.
-        hash_parameters = (
-            (self.api_login_id or "")
-            + (self.api_key or "")
-            + str(hasattr(self, "customer_id") and self.customer_id or "NoCustomerID")
-            + str(hasattr(self, "cart_id") and self.cart_id or "NoCartID")
-            + str(self.cart_items)
-            + str(self.origin)
-            + str(self.destination)
-            + fields.Date.to_string(fields.Date.today())
-        )
-        if hasattr(self, "ExemptionCertificate") and hasattr(
-            self.ExemptionCertificate, "CertificateID"
-        ):
-            hash_parameters += str(self.ExemptionCertificate.CertificateID)
-        return hashlib.sha1((hash_parameters).encode("utf-8")).hexdigest()
+        # The tax date bucket refreshes the value every day.
+        return self.fingerprint()
@@ -1 +1,3 @@
 from . import test_account_taxcloud
+from . import test_circuit_breaker
+from . import test_retry
@@ -54,6 +54,9 @@ class TestAccountTaxcloudCommon(TransactionCase):
             with patch(
                 "odoo.addons.account_taxcloud_tc.models.taxcloud_request.TaxCloudRequest.verify_address",
                 new=Mock(return_value=return_verify_address_value),
+            ), patch(
+                "odoo.addons.account_taxcloud_tc.models.taxcloud_request.TaxCloudRequest._verify_address_remote",
+                new=Mock(return_value=(return_verify_address_value, True)),
             ), patch(
                 "odoo.addons.account_taxcloud_tc.models.taxcloud_request.TaxCloudRequest.get_tic_category",
                 new=Mock(return_value=return_get_tic_category_value),
@@ -1,3 +1,5 @@
+from odoo.addons.account_taxcloud_tc.models.taxcloud_request import TaxCloudRequest
+
 from .common import TestAccountTaxcloudCommon
 
 
@@ -46,3 +48,164 @@ class TestAccountTaxcloud(TestAccountTaxcloudCommon):
                 1,
                 "Taxcloud should have generated a unique tax rate for the line.",
             )
+
+    def test_02_batch_post_isolates_failing_invoice(self):
+        """Posting several invoices concurrently validates them in one batch,
+        and an invoice failing validation does not block the others"""
+        invoices = self.env["account.move"].create(
+            [
+                {
+                    "move_type": "out_invoice",
+                    "partner_id": self.partner.id,
+                    "fiscal_position_id": self.fiscal_position.id,
+                    "invoice_line_ids": [
+                        (
+                            0,
+                            0,
+                            {
+                                "product_id": self.product.id,
+                                "tax_ids": None,
+                                "price_unit": price_unit,
+                            },
+                        ),
+                    ],
+                }
+                for price_unit in (self.product.list_price, -100.0)
+            ]
+        )
+        valid_invoice, negative_invoice = invoices
+
+        with self.mock_taxcloud():
+            invoices.with_context(taxcloud_post_concurrency=2).action_post()
+
+        self.assertEqual(valid_invoice.state, "posted")
+        self.assertEqual(len(valid_invoice.invoice_line_ids.tax_ids), 1)
+        self.assertEqual(negative_invoice.state, "draft")
+
+    def test_03_outbox_defers_authorization(self):
+        """With the outbox, posting queues AuthorizedWithCapture and the cron sends it"""
+        self.env.company.taxcloud_use_outbox = True
+        invoice = self.env["account.move"].create(
+            {
+                "move_type": "out_invoice",
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "invoice_line_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.product.id,
+                            "tax_ids": None,
+                            "price_unit": self.product.list_price,
+                        },
+                    ),
+                ],
+            }
+        )
+        with self.mock_taxcloud():
+            invoice.action_post()
+            entry = self.env["taxcloud.outbox"].search([("move_id", "=", invoice.id)])
+            self.assertEqual(entry.operation, "authorized_with_capture")
+            self.assertEqual(entry.state, "pending")
+
+            self.env["taxcloud.outbox"]._cron_process()
+        self.assertEqual(entry.state, "done")
+
+    def test_04_registered_invoice_is_not_sent_again(self):
+        """Validating a posted invoice again does not repeat the lookup and
+        the capture while its tax inputs are unchanged"""
+        invoice = self.env["account.move"].create(
+            {
+                "move_type": "out_invoice",
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "invoice_line_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.product.id,
+                            "tax_ids": None,
+                            "price_unit": self.product.list_price,
+                        },
+                    ),
+                ],
+            }
+        )
+        with self.mock_taxcloud():
+            invoice.action_post()
+            invoice.with_context(
+                taxcloud_authorize_transaction=True
+            ).validate_taxes_on_invoice()
+
+            self.assertEqual(TaxCloudRequest.get_all_taxes_values.call_count, 1)
+            self.assertEqual(
+                TaxCloudRequest.get_taxcloud_authorize_with_capture.call_count, 1
+            )
+
+    def test_05_batch_post_isolates_unexpected_error(self):
+        """Any exception raised for one invoice of a batch, not only the
+        connection errors, leaves the other invoices of the batch posted"""
+        invoices = self.env["account.move"].create(
+            [
+                {
+                    "move_type": "out_invoice",
+                    "partner_id": self.partner.id,
+                    "fiscal_position_id": self.fiscal_position.id,
+                    "invoice_line_ids": [
+                        (
+                            0,
+                            0,
+                            {
+                                "product_id": self.product.id,
+                                "tax_ids": None,
+                                "price_unit": self.product.list_price,
+                            },
+                        ),
+                    ],
+                }
+                for _index in range(2)
+            ]
+        )
+
+        with self.mock_taxcloud():
+            lookup = TaxCloudRequest.get_all_taxes_values
+            lookup.side_effect = [RuntimeError("Unexpected fault"), lookup.return_value]
+            invoices.with_context(taxcloud_post_concurrency=2).action_post()
+
+        self.assertEqual(sorted(invoices.mapped("state")), ["draft", "posted"])
+
+    def test_06_outbox_reports_the_posting_day(self):
+        """The outbox sends the reporting date in the timezone it was
+        computed in, not in the one of the user running the cron"""
+        self.env.company.taxcloud_use_outbox = True
+        invoice = self.env["account.move"].create(
+            {
+                "move_type": "out_invoice",
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "invoice_date": "2024-03-15",
+                "invoice_line_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.product.id,
+                            "tax_ids": None,
+                            "price_unit": self.product.list_price,
+                        },
+                    ),
+                ],
+            }
+        )
+        with self.mock_taxcloud():
+            invoice.with_context(tz="America/Los_Angeles").action_post()
+            entry = self.env["taxcloud.outbox"].search([("move_id", "=", invoice.id)])
+            self.assertEqual(entry.reporting_tz, "America/Los_Angeles")
+
+            self.env["taxcloud.outbox"].with_context(tz="Asia/Tokyo")._cron_process()
+            authorize = TaxCloudRequest.get_taxcloud_authorize_with_capture
+            _move, reporting_date = authorize.call_args.args
+        self.assertEqual(entry.state, "done")
+        self.assertEqual(str(reporting_date.date()), "2024-03-15")
@@ -0,0 +1,129 @@
+from unittest.mock import Mock
+
+import requests
+
+from odoo import SUPERUSER_ID, api
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.account_taxcloud_tc.models.taxcloud_request import (
+    TaxCloudUnavailable,
+)
+
+API_LOGIN_ID = "circuit-breaker-test"
+
+
+class TestTaxCloudCircuitBreaker(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        set_param = cls.env["ir.config_parameter"].sudo().set_param
+        set_param("account_taxcloud_tc.breaker_failure_threshold", 2)
+        set_param("account_taxcloud_tc.breaker_reset_seconds", 30)
+        cls.breaker = cls.env["taxcloud.circuit.breaker"].sudo()
+
+    def setUp(self):
+        super().setUp()
+        # The breaker reads and writes its state through registry cursors.
+        if self.registry.test_cr is None:
+            self.registry.enter_test_mode(self.cr)
+            self.addCleanup(self.registry.leave_test_mode)
+        self.addCleanup(type(self.breaker)._states.clear)
+        self.env.flush_all()
+        self.request = Mock(api_login_id=API_LOGIN_ID, api_key="key", timeout=(10, 60))
+
+    def _open_breaker(self):
+        failing = Mock(side_effect=requests.exceptions.ReadTimeout())
+        for _attempt in range(2):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.breaker._guard(self.request, failing)
+        return failing
+
+    def _expire_reset_timeout(self, minutes=1):
+        self.env.cr.execute(
+            """
+            UPDATE taxcloud_circuit_breaker
+               SET opened_date = opened_date - %s * INTERVAL '1 minute'
+             WHERE api_login_id = %s
+            """,
+            [minutes, API_LOGIN_ID],
+        )
+
+    def _get_db_state(self):
+        self.env.cr.execute(
+            """
+            SELECT state, failure_count
+              FROM taxcloud_circuit_breaker
+             WHERE api_login_id = %s
+            """,
+            [API_LOGIN_ID],
+        )
+        return self.env.cr.fetchone()
+
+    def test_01_opens_after_threshold(self):
+        """The breaker opens after the threshold of consecutive failures,
+        and calls then fail without reaching TaxCloud"""
+        failing = self._open_breaker()
+        with self.assertRaises(TaxCloudUnavailable):
+            self.breaker._guard(self.request, failing)
+        self.assertEqual(failing.call_count, 2)
+        self.assertEqual(self._get_db_state(), ("open", 2))
+
+    def test_02_state_shared_across_cursors(self):
+        """Another worker, with its own cursor and no cached state, sees
+        the breaker opened by this one"""
+        self._open_breaker()
+        type(self.breaker)._states.clear()
+        with self.registry.cursor() as cr:
+            breaker = api.Environment(cr, SUPERUSER_ID, {})["taxcloud.circuit.breaker"]
+            self.assertEqual(breaker._get_state(API_LOGIN_ID), ("open", 2))
+            with self.assertRaises(TaxCloudUnavailable):
+                breaker._guard(self.request, Mock())
+
+    def test_03_half_opens_after_reset_timeout(self):
+        """Once the reset timeout elapsed, a single worker probes TaxCloud,
+        and a successful probe closes the breaker"""
+        self._open_breaker()
+        self._expire_reset_timeout()
+        self.assertTrue(self.breaker._try_half_open(API_LOGIN_ID, 70))
+        self.assertFalse(self.breaker._try_half_open(API_LOGIN_ID, 70))
+        self.assertEqual(self._get_db_state(), ("half_open", 2))
+        # A probe slower than the reset timeout is not probed twice...
+        self._expire_reset_timeout()
+        self.assertFalse(self.breaker._try_half_open(API_LOGIN_ID, 70))
+
+        # ... unless it outlasted its own timeout.
+        self._expire_reset_timeout(minutes=5)
+        call = Mock(return_value="response")
+        self.assertEqual(self.breaker._guard(self.request, call), "response")
+        self.request.client.service.Ping.assert_called_once()
+        self.assertEqual(self._get_db_state(), ("closed", 0))
+
+    def test_04_failed_probe_opens_again(self):
+        """A failed probe opens the breaker again without sending the call"""
+        self._open_breaker()
+        self._expire_reset_timeout()
+        self.request.client.service.Ping.side_effect = (
+            requests.exceptions.ConnectTimeout()
+        )
+        call = Mock()
+        with self.assertRaises(TaxCloudUnavailable):
+            self.breaker._guard(self.request, call)
+        call.assert_not_called()
+        self.assertEqual(self._get_db_state()[0], "open")
+        self.assertFalse(self.breaker._try_half_open(API_LOGIN_ID))
+
+    def test_05_closed_by_another_worker(self):
+        """A worker whose cached state is open sees the breaker another
+        worker closed, without waiting for its cache to expire"""
+        self._open_breaker()
+        self.env.cr.execute(
+            """
+            UPDATE taxcloud_circuit_breaker
+               SET state = 'closed', failure_count = 0
+             WHERE api_login_id = %s
+            """,
+            [API_LOGIN_ID],
+        )
+        call = Mock(return_value="response")
+        self.assertEqual(self.breaker._guard(self.request, call), "response")
+        self.request.client.service.Ping.assert_not_called()
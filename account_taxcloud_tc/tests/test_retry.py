@@ -0,0 +1,89 @@
+from unittest.mock import Mock
+
+import requests
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.account_taxcloud_tc.models.taxcloud_request import (
+    TaxCloudRequest,
+    TaxCloudUnavailable,
+    get_call_timeout,
+)
+
+
+class TestTaxCloudRetry(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.request = TaxCloudRequest("retry-test", "key")
+        self.request.retry_base_delay = 0.0
+
+    def _error_response(self, message):
+        return Mock(
+            ResponseType="Error",
+            Messages=Mock(ResponseMessage=[Mock(Message=message)]),
+        )
+
+    def test_01_read_only_retried_after_timeout(self):
+        """Read-only operations are retried even if the request was sent"""
+        call = Mock(side_effect=[requests.exceptions.ReadTimeout(), "response"])
+        self.assertEqual(self.request._retry("LookupForDate", call), "response")
+        self.assertEqual(call.call_count, 2)
+
+    def test_02_write_retried_only_when_unsent(self):
+        """Write operations with no duplicate detection are only retried
+        when the request never reached TaxCloud"""
+        call = Mock(side_effect=[requests.exceptions.ConnectTimeout(), "response"])
+        self.assertEqual(self.request._retry("AddExemptCertificate", call), "response")
+        self.assertEqual(call.call_count, 2)
+
+        call = Mock(side_effect=[requests.exceptions.ReadTimeout(), "response"])
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.request._retry("AddExemptCertificate", call)
+        self.assertEqual(call.call_count, 1)
+
+    def test_03_idempotent_write_retried_after_timeout(self):
+        """A write whose duplicate error is recognized is retried after a
+        timeout, and the duplicate answer counts as a success"""
+        call = Mock(
+            side_effect=[
+                requests.exceptions.ReadTimeout(),
+                self._error_response("Order 42 has already been authorized"),
+            ]
+        )
+        response = self.request._retry("AuthorizedWithCapture", call)
+        self.assertEqual(response.ResponseType, "OK")
+        self.assertEqual(call.call_count, 2)
+
+    def test_04_returned_not_retried_once_sent(self):
+        """Returned is never retried after the request may have been sent"""
+        call = Mock(side_effect=[requests.exceptions.ReadTimeout(), "response"])
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.request._retry("Returned", call)
+        self.assertEqual(call.call_count, 1)
+
+        call = Mock(side_effect=[requests.exceptions.ConnectTimeout(), "response"])
+        self.assertEqual(self.request._retry("Returned", call), "response")
+        self.assertEqual(call.call_count, 2)
+
+    def test_05_open_breaker_not_retried(self):
+        """A call refused by the open circuit breaker is not retried"""
+        call = Mock(side_effect=TaxCloudUnavailable("TaxCloud circuit breaker is open"))
+        with self.assertRaises(TaxCloudUnavailable):
+            self.request._retry("LookupForDate", call)
+        self.assertEqual(call.call_count, 1)
+
+    def test_06_attempts_bounded_by_deadline(self):
+        """The read timeout of an attempt is lowered to what is left of the
+        deadline shared by the calls of the request"""
+        timeouts = []
+
+        def call():
+            timeouts.append(get_call_timeout(None))
+            return "response"
+
+        self.request.timeout = (10, 60)
+        self.request.set_deadline(20)
+        self.assertEqual(self.request._retry("LookupForDate", call), "response")
+        self.assertEqual(timeouts[0][0], 10)
+        self.assertLessEqual(timeouts[0][1], 20)
+        self.assertIsNone(get_call_timeout(None))
@@ -0,0 +1 @@
+from . import taxcloud_backfill_wizard
@@ -0,0 +1,35 @@
+from odoo import fields, models
+
+
+class TaxCloudBackfillWizard(models.TransientModel):
+    _name = "taxcloud.backfill.wizard"
+    _description = "Send Posted Invoices to TaxCloud"
+
+    company_id = fields.Many2one(
+        "res.company", required=True, default=lambda self: self.env.company
+    )
+    date_from = fields.Date(required=True)
+    date_to = fields.Date(required=True, default=fields.Date.context_today)
+    batch_size = fields.Integer(
+        required=True,
+        default=100,
+        help="Number of invoices sent per AddTransactions call.",
+    )
+
+    def action_start(self):
+        self.ensure_one()
+        backfill = self.env["taxcloud.backfill"].create(
+            {
+                "company_id": self.company_id.id,
+                "date_from": self.date_from,
+                "date_to": self.date_to,
+                "batch_size": self.batch_size,
+            }
+        )
+        backfill.action_start()
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": "taxcloud.backfill",
+            "res_id": backfill.id,
+            "view_mode": "form",
+        }
@@ -25,6 +25,7 @@
     "data": [
         "views/sale_order_views.xml",
         "views/res_config_settings_views.xml",
+        "data/ir_cron_data.xml",
     ],
     "auto_install": True,
     "license": "LGPL-3",
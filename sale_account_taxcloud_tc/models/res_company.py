@@ -3,4 +3,17 @@ from odoo import fields, models
 class ResCompany(models.Model):
     _inherit = "res.company"
 
-    is_skip_zero_orders = fields.Boolean(string="Skip Zero Orders")
\ No newline at end of file
+    is_skip_zero_orders = fields.Boolean(string="Skip Zero Orders")
+    taxcloud_use_rate_matrix = fields.Boolean(
+        string="Compute Quotation Taxes Locally",
+        help="Compute the taxes of quotations from the rates already known "
+        "for the destination and TIC codes, without calling TaxCloud. "
+        "Orders are still validated with TaxCloud on confirmation.",
+    )
+    taxcloud_degraded_mode = fields.Boolean(
+        string="Estimate Taxes When TaxCloud Is Down",
+        help="When TaxCloud cannot be reached, compute the taxes of sale "
+        "orders from the most recent known rates instead of blocking them. "
+        "Such orders are flagged as estimated and validated again "
+        "automatically once TaxCloud is back.",
+    )
@@ -6,3 +6,5 @@ class ResConfigSettings(models.TransientModel):
     _inherit = "res.config.settings"
 
     is_skip_zero_orders = fields.Boolean(string="Skip Zero Orders",related="company_id.is_skip_zero_orders", readonly=False)
+    taxcloud_use_rate_matrix = fields.Boolean(related="company_id.taxcloud_use_rate_matrix", readonly=False)
+    taxcloud_degraded_mode = fields.Boolean(related="company_id.taxcloud_degraded_mode", readonly=False)
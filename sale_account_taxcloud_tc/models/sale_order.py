@@ -17,6 +17,7 @@
 
 import datetime
 import logging
+from collections import defaultdict
 
 from odoo import SUPERUSER_ID, api, fields, models
 from odoo.exceptions import UserError, ValidationError
@@ -25,6 +26,19 @@ from odoo.tools import float_compare, float_round, ormcache
 from .taxcloud_request import TaxCloudRequest
 _logger = logging.getLogger(__name__)
 
+# Key of the cursor precommit data holding the ids of the confirmed orders
+# whose lines changed in the current transaction.
+TAXCLOUD_DIRTY_ORDERS = "sale_account_taxcloud_tc.dirty_orders"
+
+
+class _TaxCloudErrorResponse(Exception):
+    """Carries an error response out of the ormcache, so that it is not cached."""
+
+    def __init__(self, response):
+        super().__init__(response.get("error_message"))
+        self.response = response
+
+
 class SaleOrder(models.Model):
     _inherit = "sale.order"
 
@@ -33,6 +47,15 @@ class SaleOrder(models.Model):
     # Technical field to determine whether to hide taxes in views or not
     is_taxcloud = fields.Boolean(related="fiscal_position_id.is_taxcloud")
     total_tax_amount_tc = fields.Float("TaxCloud Total Tax")
+    # Inputs of the last TaxCloud validation, see _get_taxcloud_fingerprint
+    taxcloud_fingerprint = fields.Char(copy=False, readonly=True)
+    is_taxcloud_estimated = fields.Boolean(
+        string="Estimated Tax",
+        copy=False,
+        readonly=True,
+        help="TaxCloud was unreachable: taxes were estimated from the last "
+        "known rates and will be validated again automatically.",
+    )
 
     def action_quotation_send(self):
         self.validate_taxes_on_sales_order()
@@ -50,7 +73,105 @@ class SaleOrder(models.Model):
     @api.model
     @ormcache("request_hash")
     def _get_all_taxes_values(self, request, request_hash):
-        return request.get_all_taxes_values()
+        response = request.get_all_taxes_values()
+        if response.get("error_message"):
+            raise _TaxCloudErrorResponse(response)
+        return response
+
+    def _get_all_taxes_values_uncached_errors(self, request):
+        try:
+            return self._get_all_taxes_values(request, request.hash)
+        except _TaxCloudErrorResponse as error:
+            return error.response
+
+    def _get_taxcloud_lookup(self, request):
+        """Quotations share their results with identical carts through the
+        persistent lookup cache, then through the jurisdiction rate matrix
+        when enabled; confirmed orders always ask TaxCloud."""
+        if self.state not in ("draft", "sent"):
+            return self._get_all_taxes_values_uncached_errors(request)
+        LookupCache = self.env["taxcloud.lookup.cache"].sudo()
+        RateMatrix = self.env["taxcloud.rate"].sudo()
+        use_rate_matrix = self.company_id.taxcloud_use_rate_matrix
+        fingerprint = request.fingerprint(include_ids=False)
+        tax_values = LookupCache._get(fingerprint)
+        if tax_values is None and use_rate_matrix:
+            try:
+                tax_values = RateMatrix._compute_tax_values(request)
+            except OSError:
+                # Unverified address and TaxCloud unreachable,
+                # the lookup below reports it.
+                tax_values = None
+        if tax_values is not None:
+            return {"values": tax_values}
+        response = self._get_all_taxes_values_uncached_errors(request)
+        if not response.get("error_message") and response.get("values") is not None:
+            LookupCache._store(fingerprint, response["values"])
+            if use_rate_matrix:
+                RateMatrix._store_from_lookup(request, response["values"])
+        return response
+
+    @api.model
+    def _cron_taxcloud_revalidate_estimated(self, limit=200):
+        """Validate again the orders whose taxes were estimated during
+        a TaxCloud outage; stop as soon as TaxCloud is still unreachable."""
+        orders = self.search(
+            [("is_taxcloud_estimated", "=", True), ("state", "!=", "cancel")],
+            order="write_date",
+            limit=limit,
+        )
+        for order in orders:
+            try:
+                with self.env.cr.savepoint():
+                    order.validate_taxes_on_sales_order()
+            except UserError as error:
+                # E.g. an invalid address: the other orders can still be validated.
+                _logger.warning(
+                    "TaxCloud revalidation of order %s failed: %s", order.name, error
+                )
+                continue
+            if order.is_taxcloud_estimated:
+                _logger.info("TaxCloud still unreachable, estimated orders kept")
+                break
+
+    @api.model
+    def _cron_taxcloud_fill_rate_matrix(self, days=7, limit=200):
+        """Probe the rates missing for recently edited quotations, so that
+        their next revalidation is computed locally."""
+        orders = self.search(
+            [
+                ("state", "in", ("draft", "sent")),
+                ("fiscal_position_id.is_taxcloud", "=", True),
+                ("company_id.taxcloud_use_rate_matrix", "=", True),
+                ("write_date", ">=", fields.Datetime.now() - datetime.timedelta(days=days)),
+            ],
+            order="write_date desc",
+            limit=limit,
+        )
+        for order in orders:
+            try:
+                with self.env.cr.savepoint():
+                    order._fill_taxcloud_rate_matrix()
+            except (OSError, UserError) as error:
+                # The addresses are verified lazily: TaxCloud may be
+                # unreachable, or reject the address of this order only.
+                _logger.info(
+                    "TaxCloud rates of order %s not probed: %s", order.name, error
+                )
+
+    def _fill_taxcloud_rate_matrix(self):
+        self.ensure_one()
+        RateMatrix = self.env["taxcloud.rate"].sudo()
+        request = self.prepare_taxcloud_request()
+        request.taxcloud_date = fields.Datetime.context_timestamp(
+            self, datetime.datetime.now()
+        )
+        items = {item.TIC: item.ItemID for item in request.cart_items.CartItem}
+        missing_tic_codes = RateMatrix._get_missing_tic_codes(request)
+        # Probes must not overwrite the cart registered for the order.
+        request.cart_id = False
+        for tic_code in missing_tic_codes:
+            RateMatrix._probe(request, items[tic_code], tic_code)
 
     # Used to prepare the taxcloud request
     # So that we can inherit this method in another modules to update the request.
@@ -59,12 +180,51 @@ class SaleOrder(models.Model):
         api_id = shipper.taxcloud_api_id
         api_key = shipper.taxcloud_api_key
         request = self._get_TaxCloudRequest(api_id, api_key)
+        request.set_connection_detail(shipper)
         request.set_location_origin_detail(shipper)
         request.set_location_destination_detail(self.partner_shipping_id)
         request.set_order_items_detail(self)
         return request
 
+    def _mark_taxcloud_dirty(self):
+        """Validate the taxes of the orders once, before the transaction is
+        committed, however many of their lines are created or written."""
+        if not self:
+            return
+        precommit = self.env.cr.precommit
+        if TAXCLOUD_DIRTY_ORDERS not in precommit.data:
+            precommit.data[TAXCLOUD_DIRTY_ORDERS] = set()
+            env = self.env
+            precommit.add(env["sale.order"]._precommit_taxcloud_dirty_orders)
+        precommit.data[TAXCLOUD_DIRTY_ORDERS].update(self.ids)
+
+    @api.model
+    def _precommit_taxcloud_dirty_orders(self):
+        self._validate_taxcloud_dirty_orders()
+        # Precommit hooks run after the last flush of the transaction.
+        self.env.flush_all()
+
+    @api.model
+    def _validate_taxcloud_dirty_orders(self, order_ids=None):
+        """Validate the dirty orders now, all of them or those of ``order_ids``."""
+        dirty = self.env.cr.precommit.data.get(TAXCLOUD_DIRTY_ORDERS)
+        if not dirty:
+            return
+        ids = set(dirty) if order_ids is None else dirty & set(order_ids)
+        dirty -= ids
+        orders = self.browse(sorted(ids)).exists()
+        for order in orders.filtered(lambda o: o.state == "sale" and o.is_taxcloud):
+            order.validate_taxes_on_sales_order()
+
+    def _create_invoices(self, *args, **kwargs):
+        # Invoice the taxes of the lines changed in this transaction.
+        self._validate_taxcloud_dirty_orders(self.ids)
+        return super()._create_invoices(*args, **kwargs)
+
     def validate_taxes_on_sales_order(self):
+        self.env.cr.precommit.data.get(TAXCLOUD_DIRTY_ORDERS, set()).difference_update(
+            self.ids
+        )
         if not self.fiscal_position_id.is_taxcloud:
             return True
         company = self.company_id
@@ -79,7 +239,21 @@ class SaleOrder(models.Model):
             'fsm_task_id' in self._context \
             and self._context.get('fsm_task_id'):
             return True
-        response = self._get_all_taxes_values(request, request.hash)
+        if self._get_taxcloud_fingerprint(request) == self.taxcloud_fingerprint:
+            return True
+        response = self._get_taxcloud_lookup(request)
+        if response.get("unreachable") and company.taxcloud_degraded_mode:
+            estimated_values = (
+                self.env["taxcloud.rate"].sudo()._compute_estimated_tax_values(request)
+            )
+            if estimated_values is not None:
+                _logger.warning(
+                    "TaxCloud unreachable, estimating taxes of %s from known rates",
+                    self.name,
+                )
+                response = {"values": estimated_values, "estimated": True}
+        if self.is_taxcloud_estimated != bool(response.get("estimated")):
+            self.is_taxcloud_estimated = bool(response.get("estimated"))
 
         if response.get("error_message"):
             raise ValidationError(
@@ -91,78 +265,50 @@ class SaleOrder(models.Model):
         if tax_values:
             self.total_tax_amount_tc = sum([value for key, value in tax_values.items()])
 
-        # warning: this is tightly coupled to TaxCloudRequest's _process_lines method
-        # do not modify without syncing the other method
-        for index, line in enumerate(
-            self.order_line.filtered(lambda x: not x.display_type)
-        ):
-            if line._get_taxcloud_price() >= 0.0 and line.product_uom_qty >= 0.0:
-                if not line.price_subtotal and self.env.company.is_skip_zero_orders:
-                    continue
-                price = (
-                    line.price_unit
-                    * (1 - (line.discount or 0.0) / 100.0)
-                    * line.product_uom_qty
-                )
-                if not price:
-                    tax_rate = 0.0
-                else:
-                    if index in tax_values:
-                        tax_rate = tax_values[index] / price * 100
-                    else:
-                        tax_rate = 0.0
-                        _logger.warning(f"Tax value index {index} not found in tax_values.")
-                if len(line.tax_id) != 1 or float_compare(
-                    line.tax_id.amount, tax_rate, precision_digits=3
-                ):
-                    tax_rate = float_round(tax_rate, precision_digits=3)
-                    tax = (
-                        self.env["account.tax"]
-                        # .with_context(active_test=False)
-                        .sudo().search(
-                            [
-                                *self.env["account.tax"]._check_company_domain(company),
-                                ("amount", "=", tax_rate),
-                                ("amount_type", "=", "percent"),
-                                ("type_tax_use", "=", "sale"),
-                            ],
-                            limit=1,
-                        )
-                    )
-                    if not tax:
-                        # Only set if not already set, otherwise it triggers a
-                        # needless and potentially heavy recompute for
-                        # everything related to the tax.
-                        # if not tax.active:
-                            # Needs to be active to be included in order total computation
-                    #         tax.active = True
-                    # else:
-                        if company.is_default_tax_template:
-                            values = company.tax_template_id.copy_data({
-                                "name": "Tax %.3f %%" % (tax_rate),
-                                "amount": tax_rate,
-                                "invoice_label": "TaxCloud Tax",
-                                "active": True
-                            })
-                        else:
-                            values = {
-                                    "name": "Tax %.3f %%" % (tax_rate),
-                                    "amount": tax_rate,
-                                    "amount_type": "percent",
-                                    "type_tax_use": "sale",
-                                    "description": "Sales Tax",
-                                }
-                        tax = (
-                            self.env["account.tax"]
-                            .sudo()
-                            .with_context(default_company_id=company.id)
-                            .create(
-                                values
-                            )
-                        )
-                    line.tax_id = tax
+        taxes_to_set = []
+        for line in self.order_line:
+            index = request.cart_line_indexes.get(line.id)
+            if index is None:
+                continue
+            price = (
+                line.price_unit * (1 - (line.discount or 0.0) / 100.0) * line.product_uom_qty
+            )
+            if not price:
+                tax_rate = 0.0
+            elif index in tax_values:
+                tax_rate = tax_values[index] / price * 100
+            else:
+                tax_rate = 0.0
+                _logger.warning(f"Tax value index {index} not found in tax_values.")
+            if len(line.tax_id) != 1 or float_compare(
+                line.tax_id.amount, tax_rate, precision_digits=3
+            ):
+                taxes_to_set.append((line, float_round(tax_rate, precision_digits=3)))
+
+        taxes_by_rate = (
+            self.env["account.tax"]
+            .sudo()
+            .with_context(default_company_id=company.id)
+            ._get_taxcloud_taxes(company, [rate for _line, rate in taxes_to_set])
+        )
+        lines_by_tax = defaultdict(lambda: self.env["sale.order.line"])
+        for line, rate in taxes_to_set:
+            lines_by_tax[taxes_by_rate[rate]] |= line
+        for tax, lines in lines_by_tax.items():
+            lines.tax_id = tax
+        # Estimated taxes must be validated again.
+        self.taxcloud_fingerprint = (
+            not self.is_taxcloud_estimated and self._get_taxcloud_fingerprint(request)
+        )
         return True
 
+    def _get_taxcloud_fingerprint(self, request):
+        """Fingerprint of the request and of the line taxes: while it is
+        unchanged, the lookup would set the same taxes again."""
+        return request.document_fingerprint(
+            tuple(tuple(line.tax_id.ids) for line in self.order_line)
+        )
+
     def add_option_to_order_with_taxcloud(self):
         self.ensure_one()
         # portal user call this method with sudo
@@ -229,13 +375,14 @@ class SaleOrderLine(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         res = super().create(vals_list)
-        for order in res.mapped('order_id').filtered(lambda x:x.state == 'sale' and x.is_taxcloud):
-            order.validate_taxes_on_sales_order()
+        res.mapped('order_id').filtered(lambda x:x.state == 'sale' and x.is_taxcloud)._mark_taxcloud_dirty()
         return res
 
     def write(self, values):
         res = super().write(values)
+        dirty_orders = self.env["sale.order"]
         for record in self.filtered(lambda line: line.order_id.state == 'sale' and line.order_id.is_taxcloud):
             if 'product_uom_qty' in values or 'price_unit' in values or ('discount' in values and values.get('discount') != record.discount):
-                record.order_id.validate_taxes_on_sales_order()
+                dirty_orders |= record.order_id
+        dirty_orders._mark_taxcloud_dirty()
         return res
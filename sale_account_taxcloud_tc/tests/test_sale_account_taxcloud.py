@@ -1,5 +1,10 @@
+from unittest.mock import Mock, patch
+
+from odoo.addons.account_taxcloud_tc.models.taxcloud_request import TaxCloudRequest
 from odoo.addons.account_taxcloud_tc.tests.common import TestAccountTaxcloudCommon
 
+TAXCLOUD_REQUEST = "odoo.addons.account_taxcloud_tc.models.taxcloud_request.TaxCloudRequest"
+
 
 class TestSaleAccountTaxCloud(TestAccountTaxcloudCommon):
     def test_01_taxcloud_full_flow(self):
@@ -203,3 +208,111 @@ class TestSaleAccountTaxCloud(TestAccountTaxcloudCommon):
                 1,
                 "Taxcloud should have generated a unique tax rate for the line.",
             )
+
+    def test_degraded_mode_estimates_taxes(self):
+        """When TaxCloud is unreachable, taxes come from the last known rates"""
+        self.env.company.taxcloud_degraded_mode = True
+        sale_order = self.env["sale.order"].create(
+            {
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.product.id,
+                            "tax_id": None,
+                        },
+                    )
+                ],
+            }
+        )
+        verified_address = {
+            "Address1": "77 Santa Barbara Rd",
+            "Address2": "",
+            "City": "Pleasant Hill",
+            "State": "CA",
+            "Zip5": "94523",
+            "Zip4": "1234",
+        }
+        unreachable = {
+            "error_message": "TaxCloud Server Not Found",
+            "unreachable": True,
+        }
+        with patch(
+            TAXCLOUD_REQUEST + ".verify_address",
+            new=Mock(return_value=verified_address),
+        ), patch(
+            TAXCLOUD_REQUEST + ".get_all_taxes_values",
+            new=Mock(return_value=unreachable),
+        ):
+            request = sale_order.prepare_taxcloud_request()
+            tic_code = request.cart_items.CartItem[0].TIC
+            self.env["taxcloud.rate"].sudo()._store_rate(request, tic_code, 8.5, "lookup")
+            sale_order.validate_taxes_on_sales_order()
+
+        self.assertTrue(sale_order.is_taxcloud_estimated)
+        self.assertEqual(sale_order.order_line.tax_id.amount, 8.5)
+
+    def test_line_changes_validate_order_once(self):
+        """Changing several lines of a confirmed order validates it once,
+        before the commit, and the new taxes are stored"""
+        sale_order = self.env["sale.order"].create(
+            {
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "order_line": [
+                    (0, 0, {"product_id": self.product.id, "tax_id": None}),
+                    (0, 0, {"product_id": self.product_1.id, "tax_id": None}),
+                ],
+            }
+        )
+        with self.mock_taxcloud():
+            sale_order.action_confirm()
+            lookup = TaxCloudRequest.get_all_taxes_values
+            lookup_count = lookup.call_count
+            line = sale_order.order_line[0]
+            old_tax = line.tax_id
+
+            for order_line in sale_order.order_line:
+                order_line.product_uom_qty = 2
+            self.assertEqual(lookup.call_count, lookup_count, "Validation should be deferred.")
+            # A commit flushes, then runs the precommit hooks.
+            self.env.flush_all()
+            self.env.cr.precommit.run()
+            self.assertEqual(lookup.call_count, lookup_count + 1)
+
+        # Only keep what was written to the database.
+        self.env.invalidate_all(flush=False)
+        self.assertNotEqual(line.tax_id, old_tax)
+        self.assertAlmostEqual(
+            line.tax_id.amount, 6.41 / (line.price_unit * 2) * 100, places=3
+        )
+        self.assertAlmostEqual(sale_order.amount_tax, 6.41 + 0.641, delta=0.02)
+
+    def test_unchanged_order_skips_lookup(self):
+        """Validating an order again calls TaxCloud only if it changed"""
+        sale_order = self.env["sale.order"].create(
+            {
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "order_line": [
+                    (0, 0, {"product_id": self.product.id, "tax_id": None}),
+                ],
+            }
+        )
+        with self.mock_taxcloud():
+            lookup = TaxCloudRequest.get_all_taxes_values
+            sale_order.validate_taxes_on_sales_order()
+            lookup_count = lookup.call_count
+            self.assertTrue(sale_order.taxcloud_fingerprint)
+
+            sale_order.validate_taxes_on_sales_order()
+            self.assertEqual(
+                lookup.call_count, lookup_count, "An unchanged order is not sent again."
+            )
+
+            sale_order.order_line.product_uom_qty = 3
+            sale_order.validate_taxes_on_sales_order()
+            self.assertEqual(lookup.call_count, lookup_count + 1)
@@ -4,7 +4,7 @@ from odoo import models
 class AccountMove(models.Model):
     _inherit = "account.move"
 
-    def validate_taxes_on_invoice(self):
+    def _prepare_taxcloud_validation(self):
         """Override of account_taxcloud_tc to prevent
         sending authorization requests to TaxCloud."""
         self.ensure_one()
@@ -13,5 +13,5 @@ class AccountMove(models.Model):
             sale_line.amazon_item_ref
             for sale_line in self.invoice_line_ids.sale_line_ids
         ):
-            return True  # The invoice was created from an Amazon sales order, don't sync it
-        return super().validate_taxes_on_invoice()
+            return None  # The invoice was created from an Amazon sales order, don't sync it
+        return super()._prepare_taxcloud_validation()
@@ -3,3 +3,5 @@ from . import account_move
 from . import sale_order_line
 from . import sale_order
 from . import taxcloud_request
+from . import loyalty_reward
+from . import product
@@ -0,0 +1,70 @@
+from odoo import api, models, tools
+
+# Postgres sequence bumped whenever a product, product template or product
+# category is created, written or deleted.
+PRODUCTS_VERSION_SEQUENCE = "sale_loyalty_taxcloud_products_version_seq"
+# Key of the cursor data telling that the products version must be bumped
+# again at the end of the transaction.
+PRODUCTS_VERSION_BUMP = "sale_loyalty_taxcloud_tc.bump_products_version"
+
+
+class LoyaltyReward(models.Model):
+    _inherit = "loyalty.reward"
+
+    def init(self):
+        super().init()
+        self.env.cr.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS {PRODUCTS_VERSION_SEQUENCE}"
+        )
+
+    @api.model
+    def _get_taxcloud_products_version(self):
+        """Return a token that changes whenever a product, product template
+        or product category is created, written or deleted."""
+        self.env.cr.execute(
+            f"SELECT last_value, is_called FROM {PRODUCTS_VERSION_SEQUENCE}"
+        )
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _bump_taxcloud_products_version(self):
+        """Give the products a new version now, for this transaction, and
+        again once it is committed or rolled back, so that the results
+        cached meanwhile by other transactions are not reused."""
+        cr = self.env.cr
+        cr.execute(f"SELECT nextval('{PRODUCTS_VERSION_SEQUENCE}')")
+        if PRODUCTS_VERSION_BUMP not in cr.postcommit.data:
+            cr.postcommit.data[PRODUCTS_VERSION_BUMP] = True
+            cr.postcommit.add(self._bump_taxcloud_products_version_after)
+            cr.postrollback.add(self._bump_taxcloud_products_version_after)
+
+    @api.model
+    def _bump_taxcloud_products_version_after(self):
+        # Sequences are not transactional: any cursor does.
+        with self.env.registry.cursor() as cr:
+            cr.execute(f"SELECT nextval('{PRODUCTS_VERSION_SEQUENCE}')")
+
+    def _get_taxcloud_discount_product_ids(self, products_version=None):
+        """Return the ids of the products a "specific" reward applies on,
+        archived ones included, as a frozenset. The result is cached until
+        the reward or any product changes."""
+        self.ensure_one()
+        if products_version is None:
+            products_version = self._get_taxcloud_products_version()
+        return self._get_taxcloud_discount_product_ids_cached(
+            self.id, str(self.write_date), products_version
+        )
+
+    @api.model
+    @tools.ormcache("reward_id", "reward_version", "products_version")
+    def _get_taxcloud_discount_product_ids_cached(
+        self, reward_id, reward_version, products_version
+    ):
+        reward = self.sudo().browse(reward_id)
+        return frozenset(
+            self.env["product.product"]
+            .sudo()
+            .with_context(active_test=False)
+            .search(reward._get_discount_product_domain())
+            .ids
+        )
@@ -0,0 +1,52 @@
+from odoo import api, models
+
+
+class ProductTemplate(models.Model):
+    _inherit = "product.template"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().unlink()
+
+
+class ProductProduct(models.Model):
+    _inherit = "product.product"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().unlink()
+
+
+class ProductCategory(models.Model):
+    _inherit = "product.category"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env["loyalty.reward"]._bump_taxcloud_products_version()
+        return super().unlink()
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from textwrap import shorten
 
 from odoo import api, models
@@ -17,14 +18,57 @@ class SaleOrder(models.Model):
     def _update_programs_and_rewards(self, block=False):
         """Before we apply the discounts, we clean up any preset tax
         that might already since it may mess up the discount computation.
+        When the rewards come out unchanged, the taxes are set back instead:
+        TaxCloud is then only called if something else changed on the order.
+
+        Orders without any reward keep their taxes untouched. Should a
+        reward be applied to one of them, its taxes are cleared and its
+        rewards computed again.
         """
         taxcloud_orders = self.filtered("fiscal_position_id.is_taxcloud")
-        taxcloud_orders.order_line.write({"tax_id": [(Command.CLEAR,)]})
+        reward_orders = taxcloud_orders.filtered("order_line.reward_id")
+        snapshots = {
+            order: order._get_taxcloud_reward_snapshot() for order in reward_orders
+        }
+        lines_with_taxes = reward_orders.order_line.filtered("tax_id")
+        taxes_by_line = {line: line.tax_id for line in lines_with_taxes}
+        lines_with_taxes.write({"tax_id": [Command.clear()]})
         res = super()._update_programs_and_rewards()
+        new_reward_orders = (taxcloud_orders - reward_orders).filtered(
+            "order_line.reward_id"
+        )
+        if new_reward_orders:
+            new_reward_orders.order_line.filtered("tax_id").write(
+                {"tax_id": [Command.clear()]}
+            )
+            super(SaleOrder, new_reward_orders)._update_programs_and_rewards()
+        lines_by_taxes = defaultdict(lambda: self.env["sale.order.line"])
+        for order in reward_orders:
+            if order._get_taxcloud_reward_snapshot() == snapshots[order]:
+                for line in order.order_line & lines_with_taxes:
+                    lines_by_taxes[taxes_by_line[line]] |= line
+        for taxes, lines in lines_by_taxes.items():
+            lines.tax_id = taxes
         for order in taxcloud_orders.filtered(lambda x:x.order_line):
             order.validate_taxes_on_sales_order()
         return res
 
+    def _get_taxcloud_reward_snapshot(self):
+        """Return the reward lines and discountable amounts of the order.
+        While they are the same, the TaxCloud taxes of the lines still hold."""
+        self.ensure_one()
+        return tuple(
+            (
+                line.id,
+                line.reward_id.id,
+                line.product_id.id,
+                line.product_uom_qty,
+                line.price_unit,
+                line.discount,
+            )
+            for line in self.order_line
+        )
+
     def _create_invoices(self, grouped=False, final=False, date=None):
         """Ensure that any TaxCloud order that has discounts is invoiced in one go.
         Indeed, since the tax computation of discount lines with Taxcloud
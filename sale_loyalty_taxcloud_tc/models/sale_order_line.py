@@ -1,6 +1,19 @@
 from odoo import api, fields, models
 from odoo.exceptions import UserError
 
+# Fields that cannot change on invoiced TaxCloud orders with promotions
+TAXCLOUD_PROMO_BLOCKED_FIELDS = (
+    "product_id",
+    "price_unit",
+    "price_subtotal",
+    "price_tax",
+    "price_total",
+    "tax_id",
+    "discount",
+    "product_uom_qty",
+    "product_qty",
+)
+
 
 class SaleOrderLine(models.Model):
     _inherit = "sale.order.line"
@@ -11,31 +24,19 @@ class SaleOrderLine(models.Model):
     def _check_taxcloud_promo(self, vals):
         """Ensure that users cannot modify sale order lines of a Taxcloud order
         with promotions if there is already a valid invoice"""
+        if any(field in vals for field in TAXCLOUD_PROMO_BLOCKED_FIELDS):
+            self._check_taxcloud_promo_lock()
 
-        blocked_fields = (
-            "product_id",
-            "price_unit",
-            "price_subtotal",
-            "price_tax",
-            "price_total",
-            "tax_id",
-            "discount",
-            "product_id",
-            "product_uom_qty",
-            "product_qty",
+    def _check_taxcloud_promo_lock(self):
+        # The flags are computed once per order, not once per line.
+        lines = self.filtered(
+            lambda line: not line.display_type and line.order_id.is_taxcloud
         )
-        for line in self:
-            if (
-                line.order_id.is_taxcloud
-                and not line.display_type
-                and any(field in vals for field in blocked_fields)
-                and any(
-                    line.order_id.order_line.mapped(
-                        lambda sol: sol.invoice_status not in ("no", "to invoice")
-                    )
-                )
-                and any(line.order_id.order_line.mapped("is_reward_line"))
-            ):
+        for order in lines.order_id:
+            if any(
+                line.invoice_status not in ("no", "to invoice")
+                for line in order.order_line
+            ) and any(line.is_reward_line for line in order.order_line):
                 raise UserError(
                     self.env._(
                         "Orders with coupons or promotions programs that use TaxCloud for "
@@ -52,8 +53,11 @@ class SaleOrderLine(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         lines = super().create(vals_list)
-        for line, vals in zip(lines, vals_list):
-            line._check_taxcloud_promo(vals)
+        lines.browse([
+            line.id
+            for line, vals in zip(lines, vals_list)
+            if any(field in vals for field in TAXCLOUD_PROMO_BLOCKED_FIELDS)
+        ])._check_taxcloud_promo_lock()
         return lines
 
     def _get_taxcloud_price(self):
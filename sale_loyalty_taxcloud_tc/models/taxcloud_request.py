@@ -1,13 +1,106 @@
+from collections import defaultdict
+
+from odoo.tools import float_round
+
 from odoo.addons.sale_account_taxcloud_tc.models import taxcloud_request
 
 
-def subn(price, discount):
+def spread_evenly(totals, indexes, discount):
+    """Spread ``discount`` over ``totals`` at ``indexes``, in proportion to
+    them. Amounts are integers in the smallest currency unit: the shares are
+    rounded with the largest remainder method, so that they sum up exactly
+    to the discount. No total goes below 0.
+
+    :param totals: list of positive integers, updated in place
+    :param indexes: indexes of the totals to discount
+    :param discount: negative integer
+    :return: the part of the discount that could not be applied
     """
-    :param price: positive number
-    :param discount: negative number
-    :return: natural subtraction of the discount to the price, and the remainder
+    amount = sum(totals[i] for i in indexes)
+    if not amount:
+        return discount
+    to_apply = min(-discount, amount)
+    shares = {}
+    remainders = []
+    for i in indexes:
+        shares[i], remainder = divmod(to_apply * totals[i], amount)
+        remainders.append((-remainder, len(remainders), i))
+    for _remainder, _order, i in sorted(remainders)[: to_apply - sum(shares.values())]:
+        shares[i] += 1
+    for i, share in shares.items():
+        totals[i] -= share
+    return discount + to_apply
+
+
+def spread_sequentially(totals, indexes, discount):
+    """Apply ``discount`` on ``totals`` at ``indexes``, one after the other,
+    down to 0. Same units as ``spread_evenly``.
+
+    :return: the part of the discount that could not be applied
+    """
+    for i in indexes:
+        if not discount:
+            break
+        share = min(totals[i], -discount)
+        totals[i] -= share
+        discount += share
+    return discount
+
+
+class DiscountAllocation:
+    """TaxCloud prices of ``lines`` while discounts are applied on them.
+
+    The prices are kept as line totals in the smallest currency unit, so that
+    the discounts are applied exactly and the ORM records are only written
+    once all the discounts are applied.
     """
-    return max(price + discount, 0), min(price + discount, 0)
+
+    def __init__(self, lines):
+        currency = lines.currency_id[:1]
+        self.factor = 10 ** (currency.decimal_places if currency else 2)
+        self.lines = lines
+        self.indexes = {line: i for i, line in enumerate(lines)}
+        self.qtys = [line._get_qty() for line in lines]
+        self.totals = [
+            self.to_units(line.price_unit * qty) for line, qty in zip(lines, self.qtys)
+        ]
+        self.changed = set()
+
+    def to_units(self, amount):
+        return int(float_round(amount * self.factor, precision_digits=0))
+
+    def price(self, line):
+        """Current TaxCloud unit price of ``line``."""
+        i = self.indexes[line]
+        if i not in self.changed:
+            return line.price_unit
+        return self.totals[i] / self.factor / self.qtys[i]
+
+    def discountable(self, lines):
+        """Lines with a positive price and quantity left."""
+        return lines.filtered(
+            lambda line: self.price(line) > 0 and self.qtys[self.indexes[line]] > 0
+        )
+
+    def apply(self, discount, lines):
+        """Apply ``discount`` (a negative amount) evenly on ``lines``, then
+        sequentially. Return the part that could not be applied, in units."""
+        indexes = [self.indexes[line] for line in lines]
+        before = [self.totals[i] for i in indexes]
+        discount = spread_evenly(self.totals, indexes, discount)
+        discount = spread_sequentially(self.totals, indexes, discount)
+        self.changed.update(
+            i for i, total in zip(indexes, before) if self.totals[i] != total
+        )
+        return discount
+
+    def write(self):
+        """Set the TaxCloud prices on the lines, one write per price."""
+        lines_by_price = defaultdict(list)
+        for line in self.lines:
+            lines_by_price[self.price(line)].append(line.id)
+        for price, line_ids in lines_by_price.items():
+            self.lines.browse(line_ids).price_taxcloud = price
 
 
 class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
@@ -16,6 +109,11 @@ class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
     This gives us the taxes per line, as before, so we don't need to change anything else.
     """
 
+    # DiscountAllocation of the lines being processed
+    allocation = None
+    # Products token of the eligible product caches, read once per cart
+    products_version = None
+
     def _process_lines(self, lines):
         self._apply_discount_on_lines(lines)
         return super()._process_lines(lines)
@@ -26,44 +124,24 @@ class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
         In the case there is still a remainder, it is ignored,
         as it would be a negative SO/invoice without taxes anyway.
         """
-        for line in lines:
-            line.price_taxcloud = line.price_unit
+        self.allocation = allocation = DiscountAllocation(lines)
+        self.products_version = None
 
         discounts_to_apply = lines.filtered(lambda x: x.reward_id)
         sorted_discounts = discounts_to_apply.sorted(key=self._rank_discount_line)
 
         for discount_line in sorted_discounts:
             discountable_lines = self._get_discountable_lines(discount_line, lines)
-            discount_sum = discount_line._get_qty() * discount_line.price_unit
-            remainder = self._apply_evenly(discount_sum, discountable_lines)
-            remainder = self._apply_sequentially(remainder, discountable_lines)
+            discount_sum = allocation.to_units(
+                discount_line._get_qty() * discount_line.price_unit
+            )
+            if discount_sum >= 0:
+                continue
+            remainder = allocation.apply(discount_sum, discountable_lines)
             if remainder:  # in case some product-specific discount
                 # could not be applied, backup on all lines
-                all_discountable_lines = lines.filtered(
-                    lambda x: x.price_taxcloud > 0 and x._get_qty() > 0
-                )
-                remainder = self._apply_evenly(remainder, all_discountable_lines)
-                remainder = self._apply_sequentially(remainder, all_discountable_lines)
-
-    def _apply_evenly(self, discount, lines):
-        remainder = 0
-        sum_lines = sum(x.price_taxcloud * x._get_qty() for x in lines)
-        if sum_lines:
-            for line in lines:
-                ratio = (line._get_qty() * line.price_taxcloud) / sum_lines
-                line_discount = (ratio * discount) / line._get_qty()
-                line.price_taxcloud, remains = subn(line.price_taxcloud, line_discount)
-                remainder += remains * line._get_qty()
-        else:
-            remainder = discount
-        return remainder
-
-    def _apply_sequentially(self, discount, lines):
-        for line in lines:
-            line_discount = discount / line._get_qty()
-            line.price_taxcloud, remains = subn(line.price_taxcloud, line_discount)
-            discount = remains * line._get_qty()
-        return discount
+                allocation.apply(remainder, allocation.discountable(lines))
+        allocation.write()
 
     def _rank_discount_line(self, line):
         return [
@@ -75,18 +153,20 @@ class TaxCloudRequest(taxcloud_request.TaxCloudRequest):
 
     def _get_discountable_lines(self, discount_line, lines):
         reward = discount_line.reward_id
-        lines = lines.filtered(lambda x: x.price_taxcloud > 0 and x._get_qty() > 0)
+        lines = self.allocation.discountable(lines)
         if reward.reward_type == "product":
             lines = lines.filtered(
                 lambda x: x.product_id == reward.reward_product_id
                 and not x.reward_id
             )
         elif reward.discount_applicability == "specific":
-            domain = reward._get_discount_product_domain()
-            lines = lines.filtered(lambda x: x.product_id.filtered_domain(domain))
+            if self.products_version is None:
+                self.products_version = reward._get_taxcloud_products_version()
+            product_ids = reward._get_taxcloud_discount_product_ids(self.products_version)
+            lines = lines.filtered(lambda x: x.product_id.id in product_ids)
         elif reward.discount_applicability == "cheapest":
             lines = self._get_cheapest_line(lines)
         return lines
 
     def _get_cheapest_line(self, lines):
-        return min(lines, key=lambda x: x["price_taxcloud"]) if lines else lines
+        return min(lines, key=self.allocation.price) if lines else lines
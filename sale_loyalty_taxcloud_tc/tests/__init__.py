@@ -1,2 +1,3 @@
 from . import test_sum_price_taxcloud
 from . import test_taxcloud_flow
+from . import test_promo_lock_benchmark
@@ -0,0 +1,71 @@
+import time
+
+from odoo.fields import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged("-standard", "taxcloud_benchmark")
+class TestPromoLockBenchmark(TransactionCase):
+    """Check that the promotion lock of TaxCloud orders scales linearly with
+    the number of lines. Not run by default:
+    ``--test-tags taxcloud_benchmark``
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fiscal_position = cls.env["account.fiscal.position"].create(
+            {"name": "TaxCloud", "is_taxcloud": True}
+        )
+        cls.partner = cls.env["res.partner"].create({"name": "Benchmark Customer"})
+        cls.product = cls.env["product.product"].create(
+            {"name": "Benchmark Product", "list_price": 10, "taxes_id": False}
+        )
+        cls.program = cls.env["loyalty.program"].create(
+            {
+                "name": "10% Promotion",
+                "program_type": "promotion",
+                "trigger": "auto",
+                "reward_ids": [Command.create({"discount": 10})],
+            }
+        )
+
+    def _create_promo_order(self, line_count):
+        reward = self.program.reward_ids
+        return self.env["sale.order"].create(
+            {
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "order_line": [
+                    Command.create({"product_id": self.product.id, "product_uom_qty": 1})
+                    for _i in range(line_count - 1)
+                ]
+                + [
+                    Command.create(
+                        {
+                            "product_id": reward.discount_line_product_id.id,
+                            "reward_id": reward.id,
+                            "price_unit": -1,
+                        }
+                    )
+                ],
+            }
+        )
+
+    def _time_lock_check(self, order):
+        order.invalidate_recordset()
+        order.order_line.invalidate_recordset()
+        start = time.perf_counter()
+        order.order_line._check_taxcloud_promo({"discount": 0})
+        return time.perf_counter() - start
+
+    def test_promo_lock_scales_linearly(self):
+        small = self._create_promo_order(1000)
+        large = self._create_promo_order(2000)
+        self.assertTrue(any(large.order_line.mapped("is_reward_line")))
+        # Warm up, then keep the best of a few runs.
+        self._time_lock_check(small)
+        small_time = min(self._time_lock_check(small) for _i in range(3))
+        large_time = min(self._time_lock_check(large) for _i in range(3))
+        # Quadratic would be about 4 times slower for twice the lines.
+        self.assertLess(large_time, small_time * 3)
@@ -2,6 +2,10 @@ import itertools
 
 from . import common
 from odoo.addons.account_taxcloud_tc.tests.common import TestAccountTaxcloudCommon
+from odoo.addons.sale_loyalty_taxcloud_tc.models.taxcloud_request import (
+    spread_evenly,
+    spread_sequentially,
+)
 
 
 def record_powerset(records):
@@ -66,3 +70,37 @@ class TestSaleCouponPriceTaxCloud(common.TestSaleCouponTaxCloudCommon,TestAccoun
         other_lines = lines.filtered(lambda x: x.price_taxcloud > 0) - line_C
         for line in other_lines:
             self.assertAlmostEqual(line.price_taxcloud, line.price_unit)
+
+    def test_spread_discount_exactly(self):
+        """Test that a discount is spread on the lines to the cent, and that
+        what cannot be applied is returned."""
+        totals = [10000, 5000, 1000]
+        remainder = spread_evenly(totals, [0, 1, 2], -1000)
+        self.assertEqual(remainder, 0)
+        self.assertEqual(totals, [9375, 4687, 938])
+
+        totals = [100, 100, 100]
+        self.assertEqual(spread_evenly(totals, [0, 1, 2], -100), 0)
+        self.assertEqual(sum(totals), 200)
+
+        totals = [500, 300]
+        self.assertEqual(spread_evenly(totals, [0, 1], -1000), -200)
+        self.assertEqual(totals, [0, 0])
+
+        totals = [500, 300]
+        self.assertEqual(spread_sequentially(totals, [1, 0], -400), 0)
+        self.assertEqual(totals, [400, 0])
+
+    def test_eligible_products_follow_product_changes(self):
+        """The products a specific reward applies on are cached until a
+        product changes"""
+        reward = self.program_free_product_C.reward_ids
+        Reward = self.env["loyalty.reward"]
+        version = Reward._get_taxcloud_products_version()
+        self.assertEqual(Reward._get_taxcloud_products_version(), version)
+        self.assertIn(self.product_C.id, reward._get_taxcloud_discount_product_ids())
+
+        self.product_A.name = "A renamed"
+        self.assertNotEqual(Reward._get_taxcloud_products_version(), version)
+        reward.discount_product_ids |= self.product_A
+        self.assertIn(self.product_A.id, reward._get_taxcloud_discount_product_ids())
@@ -129,3 +129,45 @@ class TestSaleCouponTaxCloudFlow(common.TestSaleCouponTaxCloudCommon):
             4,
             "Confirming the sale order should not alter the taxes",
         )
+
+    def test_unchanged_rewards_keep_taxes(self):
+        """Updating the rewards of an order does not wipe its taxes when the
+        rewards come out unchanged, and TaxCloud is not called again"""
+        self.response = "discounted"
+        self._apply_promo_code(self.order, self.program_order_percent.coupon_ids.code)
+        self.order.validate_taxes_on_sales_order()
+        taxes_by_line = {line: line.tax_id for line in self.order.order_line}
+        self.assertTrue(self.order.order_line.tax_id)
+
+        with patch.object(
+            type(self.order),
+            "_get_taxcloud_lookup",
+            autospec=True,
+            side_effect=type(self.order)._get_taxcloud_lookup,
+        ) as lookup:
+            self.order._update_programs_and_rewards()
+        lookup.assert_not_called()
+        self.assertEqual(
+            {line: line.tax_id for line in self.order.order_line}, taxes_by_line
+        )
+        self.assertAlmostEqual(self.order.amount_tax, 12.78, 4)
+
+    def test_orders_without_rewards_keep_taxes(self):
+        """Updating the rewards of an order without any reward does not
+        write its taxes at all"""
+        self.response = "full"
+        self.order.validate_taxes_on_sales_order()
+        taxes_by_line = {line: line.tax_id for line in self.order.order_line}
+        self.assertTrue(self.order.order_line.tax_id)
+
+        SaleOrderLine = type(self.env["sale.order.line"])
+        with patch.object(
+            SaleOrderLine, "write", autospec=True, side_effect=SaleOrderLine.write
+        ) as write:
+            self.order._update_programs_and_rewards()
+        self.assertFalse(
+            [call for call in write.call_args_list if "tax_id" in call.args[1]]
+        )
+        self.assertEqual(
+            {line: line.tax_id for line in self.order.order_line}, taxes_by_line
+        )
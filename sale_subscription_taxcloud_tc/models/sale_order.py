@@ -15,7 +15,9 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
-from odoo import models
+from datetime import timedelta
+
+from odoo import fields, models
 
 
 class SaleOrder(models.Model):
@@ -24,11 +26,52 @@ class SaleOrder(models.Model):
 
     _inherit = "sale.order"
 
+    def _handle_automatic_invoices(self, invoices, auto_commit):
+        validated, outbox_dates = self._validate_taxcloud_renewal_invoices(invoices)
+        context = {
+            "taxcloud_validated_invoice_ids": validated.ids,
+            "taxcloud_outbox_dates": outbox_dates,
+        }
+        return super(
+            SaleOrder, self.with_context(**context)
+        )._handle_automatic_invoices(invoices.with_context(**context), auto_commit)
+
+    def _validate_taxcloud_renewal_invoices(self, invoices):
+        """Compute the TaxCloud taxes of the renewal ``invoices`` at once,
+        through a pool of ``renewal_concurrency`` threads, before any of them
+        is charged.
+
+        Return the invoices validated, and ``{invoice id: datetime}`` to
+        queue their AuthorizedWithCapture at, spread over ``capture_window``
+        minutes, so that a renewal run does not hit TaxCloud with all its
+        calls at once. They are only authorized once paid, when posted. The
+        other invoices are validated by ``_do_payment`` as before.
+        """
+        invoices = invoices.filtered(
+            lambda invoice: invoice.fiscal_position_id.is_taxcloud
+            and invoice.move_type in ["out_invoice", "out_refund"]
+        )
+        if not invoices:
+            return invoices, {}
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        concurrency = int(get_param("sale_subscription_taxcloud_tc.renewal_concurrency", 4))
+        window = int(get_param("sale_subscription_taxcloud_tc.capture_window", 60))
+        validated, _errors = invoices._validate_taxes_on_invoices(max(concurrency, 1))
+        outbox_dates = {}
+        if window > 0:
+            queued = validated.filtered("company_id.taxcloud_use_outbox")
+            now = fields.Datetime.now()
+            step = timedelta(minutes=window) / max(len(queued), 1)
+            for index, invoice in enumerate(queued):
+                outbox_dates[invoice.id] = now + step * index
+        return validated, outbox_dates
+
     def _do_payment(self, payment_token, invoice, auto_commit=False):
-        if invoice.fiscal_position_id.is_taxcloud and invoice.move_type in [
-            "out_invoice",
-            "out_refund",
-        ]:
+        if (
+            invoice.fiscal_position_id.is_taxcloud
+            and invoice.move_type in ["out_invoice", "out_refund"]
+            and invoice.id not in self.env.context.get("taxcloud_validated_invoice_ids", ())
+        ):
             invoice.with_context(
                 taxcloud_authorize_transaction=True
             ).validate_taxes_on_invoice()
@@ -0,0 +1 @@
+from . import test_sale_subscription_taxcloud
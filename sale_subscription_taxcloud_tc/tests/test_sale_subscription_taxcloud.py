@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+from odoo.addons.account_taxcloud_tc.models.taxcloud_request import TaxCloudRequest
+from odoo.addons.account_taxcloud_tc.tests.common import TestAccountTaxcloudCommon
+
+SUBSCRIPTION_ORDER = "odoo.addons.sale_subscription.models.sale_order.SaleOrder"
+
+
+class TestSaleSubscriptionTaxCloud(TestAccountTaxcloudCommon):
+    def _create_invoice(self, product):
+        return self.env["account.move"].create(
+            {
+                "move_type": "out_invoice",
+                "partner_id": self.partner.id,
+                "fiscal_position_id": self.fiscal_position.id,
+                "invoice_line_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": product.id,
+                            "tax_ids": None,
+                            "price_unit": product.list_price,
+                        },
+                    ),
+                ],
+            }
+        )
+
+    def test_renewal_invoices_validated_before_charging(self):
+        """The renewal invoices are validated in one batch before any of
+        them is charged, charging does not validate them again, and none is
+        authorized before being paid"""
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_subscription_taxcloud_tc.capture_window", 0
+        )
+        invoices = self._create_invoice(self.product) + self._create_invoice(
+            self.product_1
+        )
+        lookup_counts = []
+
+        # Stand-ins for the subscription renewal, charging each invoice.
+        def handle_automatic_invoices(orders, invoices, auto_commit):
+            for invoice in invoices:
+                orders._do_payment(
+                    self.env["payment.token"], invoice, auto_commit=auto_commit
+                )
+            return invoices
+
+        def do_payment(orders, payment_token, invoice, auto_commit=False):
+            lookup_counts.append(TaxCloudRequest.get_all_taxes_values.call_count)
+
+        with self.mock_taxcloud(), patch(
+            SUBSCRIPTION_ORDER + "._handle_automatic_invoices",
+            handle_automatic_invoices,
+        ), patch(SUBSCRIPTION_ORDER + "._do_payment", do_payment):
+            lookup = TaxCloudRequest.get_all_taxes_values
+            authorize = TaxCloudRequest.get_taxcloud_authorize_with_capture
+            self.env["sale.order"]._handle_automatic_invoices(invoices, False)
+
+        self.assertTrue(lookup.call_count)
+        self.assertEqual(lookup_counts, [lookup.call_count] * 2)
+        authorize.assert_not_called()
+        for invoice in invoices:
+            self.assertEqual(len(invoice.invoice_line_ids.tax_ids), 1)
+
+    def test_renewal_captures_queued_once_paid(self):
+        """The AuthorizedWithCapture of the renewal invoices are queued,
+        spread over the capture window, only for the invoices paid"""
+        self.env.company.taxcloud_use_outbox = True
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_subscription_taxcloud_tc.capture_window", 60
+        )
+        paid = self._create_invoice(self.product) + self._create_invoice(
+            self.product_1
+        )
+        unpaid = self._create_invoice(self.product)
+
+        # Stand-in for the subscription renewal, the payment of the last
+        # invoice failing.
+        def handle_automatic_invoices(orders, invoices, auto_commit):
+            invoices.filtered(lambda invoice: invoice != unpaid)._post()
+            return invoices
+
+        with self.mock_taxcloud(), patch(
+            SUBSCRIPTION_ORDER + "._handle_automatic_invoices",
+            handle_automatic_invoices,
+        ):
+            authorize = TaxCloudRequest.get_taxcloud_authorize_with_capture
+            self.env["sale.order"]._handle_automatic_invoices(
+                paid + unpaid, False
+            )
+
+        authorize.assert_not_called()
+        entries = self.env["taxcloud.outbox"].search(
+            [("move_id", "in", (paid + unpaid).ids)]
+        )
+        self.assertEqual(entries.move_id, paid)
+        self.assertEqual(len(set(entries.mapped("next_attempt_date"))), 2)
+        self.assertFalse(unpaid.taxcloud_captured_fingerprint)